@@ -0,0 +1,107 @@
+import argparse
+import fnmatch
+import json
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+import electrode_catalog
+import electrode_geometry
+import exporters
+import metrics
+
+
+def select_electrodes(elspecs, patterns):
+    # electrode names matching any of the names or glob patterns, in the order of the spec file
+    return [name for name in elspecs if any(fnmatch.fnmatchcase(name, pattern) for pattern in patterns)]
+
+
+def save_mesh(path, final, names):
+    np.savez(path, vertices=final.vertices.astype(np.float32), faces=final.faces.astype(np.int32),
+             material=final.material_index.astype(np.uint8), component=final.component_index.astype(np.int16),
+             component_names=np.array(names), face_offsets=final.face_offsets(len(names)))
+
+
+def build_one(name, elspec, nr_vertices, output_dir, chordal_tolerance=None, formats=('npz',), quantize=None, check=False):
+    # build a single electrode with the geometry engine and write it to output_dir, runs in a worker process
+    start = time.perf_counter()
+    item = {'electrode': name, 'nr_vertices': nr_vertices}
+    try:
+        final, parts = electrode_geometry.build_electrode(elspec, nr_vertices, name, chordal_tolerance=chordal_tolerance)
+        build_time = time.perf_counter() - start
+        files = []
+        for file_format in formats:
+            path = os.path.join(output_dir, f'{name}_{nr_vertices}.{file_format}')
+            if file_format == 'npz':
+                save_mesh(path, final, [component['name'] for component, _ in parts])
+            else:
+                exporters.writers[file_format](path, final, quantize)
+            files.append(os.path.basename(path))
+        item.update(status='ok', files=files, vertices=len(final.vertices), faces=len(final.faces),
+                    build_seconds=build_time, write_seconds=time.perf_counter() - start - build_time)
+        if check:
+            item['metrics'] = metrics.electrode_metrics(elspec, final, parts, nr_vertices)
+            if not item['metrics']['ok']:
+                item.update(status='failed', error='failed checks: ' + ', '.join(metrics.failures(item['metrics'])))
+    except Exception as e:
+        item.update(status='failed', error=f'{type(e).__name__}: {e}', traceback=traceback.format_exc())
+    item['seconds'] = time.perf_counter() - start
+    return item
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Build electrode models from a spec file without Blender.')
+    parser.add_argument('spec_file', help='electrode specification (.json)')
+    parser.add_argument('electrodes', nargs='*', default=['*'], help='electrode names or glob patterns (default: all)')
+    parser.add_argument('-r', '--resolution', type=int, nargs='+', default=[72], help='values of nr_vertices to build')
+    parser.add_argument('--lod', action='store_true', help=f'build the level of detail chain {electrode_geometry.LOD_LEVELS} instead of --resolution')
+    parser.add_argument('--chordal-tolerance', type=float, help='maximum deviation of the tip from a sphere in mm '
+                                                                '(default: same as the circumference, or nr_vertices / 4 rings without --lod)')
+    parser.add_argument('-f', '--format', nargs='+', default=['npz'], choices=['npz'] + sorted(exporters.writers), help='output formats')
+    parser.add_argument('--quantize', choices=['int16'], help='store the vertex positions of PLY and glTF files as 16 bit integers (STL files keep float32)')
+    parser.add_argument('--check', action='store_true', help='check areas, volume, length and manifoldness of every mesh (see metrics.py), '
+                                                              'meshes that fail count as failed')
+    parser.add_argument('-o', '--output-dir', default='electrodes', help='folder for the meshes and manifest.json')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(), help='number of worker processes')
+    args = parser.parse_args(argv)
+
+    elspecs = electrode_catalog.ElectrodeCatalog(args.spec_file)
+    names = select_electrodes(elspecs, args.electrodes)
+    if not names:
+        parser.error('no electrode matches ' + ' '.join(args.electrodes))
+    os.makedirs(args.output_dir, exist_ok=True)
+    resolutions = electrode_geometry.LOD_LEVELS if args.lod else args.resolution
+
+    def tolerance(elspec, nr_vertices):
+        if args.lod and args.chordal_tolerance is None:
+            return electrode_geometry.chordal_error(elspec['lead_diameter'] / 2, nr_vertices)
+        return args.chordal_tolerance
+
+    start = time.perf_counter()
+    items = []
+    with ProcessPoolExecutor(max_workers=args.jobs) as executor:
+        futures = [executor.submit(build_one, name, elspecs[name], nr_vertices, args.output_dir, tolerance(elspecs[name], nr_vertices),
+                                   args.format, args.quantize, args.check)
+                   for name in names for nr_vertices in resolutions]
+        for future in as_completed(futures):
+            item = future.result()
+            items.append(item)
+            print(f"{item['electrode']} ({item['nr_vertices']}): {item['status']} in {item['seconds']:.3f} s")
+
+    items.sort(key=lambda item: (names.index(item['electrode']), item['nr_vertices']))
+    failed = [item for item in items if item['status'] != 'ok']
+    manifest = {'spec_file': os.path.abspath(args.spec_file), 'generator_version': electrode_geometry.GENERATOR_VERSION,
+                'seconds': time.perf_counter() - start, 'built': len(items) - len(failed), 'failed': len(failed), 'items': items}
+    with open(os.path.join(args.output_dir, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+    print(f"{manifest['built']} built, {manifest['failed']} failed in {manifest['seconds']:.2f} s")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,170 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))  # blender --python does not add the folder of the script
+
+import electrode_catalog
+import electrode_geometry
+import instrumentation
+
+# stage-level benchmark of the electrode generator: every electrode of a spec file is built at every resolution, the wall time,
+# peak memory, mesh size and number of bpy.ops calls of each stage (see the @stage functions) are written to a JSON file
+# stages can be nested, the time of a stage includes its nested stages
+# with --compare, the stages are checked against an earlier result and the exit code is 1 if any of them got slower
+#
+# --mode engine (default) runs the numpy engine (electrode_geometry.build_electrode) without Blender, it has no bpy.ops calls
+# --mode geometry and --mode operators build with create_electrode_model.construct_electrode and have to run in Blender:
+#     blender -b --python benchmark.py -- --mode operators --resolution 36 72 --output operators.json
+
+MODES = ('engine', 'geometry', 'operators')
+min_seconds = 1e-3  # stages faster than this in the baseline are not compared (too noisy)
+
+
+def build_function(mode):
+    # (reset, build) of the given mode: build(name, elspec, nr_vertices) -> (vertices, faces) builds one electrode,
+    # reset() is called before every build (and not measured), so every run is a cold build
+    if mode == 'engine':
+        def build(name, elspec, nr_vertices):
+            final, _ = electrode_geometry.build_electrode(elspec, nr_vertices, name)
+            return len(final.vertices), len(final.faces)
+        return electrode_geometry.clear_cache, build
+
+    import bpy
+    for module in ('add_curve_extra_objects',):  # curve.simple of the operator pipeline
+        try:
+            bpy.ops.preferences.addon_enable(module=module)
+        except Exception as e:
+            print(f'could not enable {module}: {e}')
+    import create_electrode_model
+    import electrode_builder
+
+    def build(name, elspec, nr_vertices):
+        final = create_electrode_model.construct_electrode(name, electrode_builder.ElectrodeBuilder(elspec, nr_vertices, name), mode)
+        return len(final.data.vertices), len(final.data.polygons)
+    # the objects of the previous run would otherwise keep their fingerprints, and geometry mode would only move them
+    return create_electrode_model.reset_build_state, build
+
+
+def benchmark_electrode(name, elspec, nr_vertices, repeats=5, mode=None):
+    # the total time and the time of every stage are the medians of all repeats (calls, mesh sizes and operator calls do
+    # not change between runs), memory is measured in a separate run because tracemalloc slows down the stages
+    # mode: (reset, build) of build_function, default: the numpy engine
+    reset, build = mode or build_function('engine')
+    runs = []
+    for _ in range(repeats):
+        reset()
+        with instrumentation.recording() as recorder, instrumentation.count_operators():
+            start = time.perf_counter()
+            vertices, faces = build(name, elspec, nr_vertices)
+            runs.append((time.perf_counter() - start, recorder.stages))
+
+    reset()
+    tracemalloc.start()
+    try:
+        with instrumentation.recording(trace_memory=True) as memory:
+            build(name, elspec, nr_vertices)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    stages = runs[0][1]
+    for stage_name, stats in stages.items():
+        stats['seconds'] = float(np.median([run[stage_name]['seconds'] for _, run in runs]))
+        stats['peak_bytes'] = memory.stages[stage_name]['peak_bytes']
+    return {'electrode': name, 'nr_vertices': nr_vertices, 'seconds': float(np.median([seconds for seconds, _ in runs])),
+            'peak_bytes': peak, 'vertices': vertices, 'faces': faces, 'stages': stages}
+
+
+def stage_totals(results):
+    # sum of every stage over all electrodes, per resolution
+    totals = {}
+    for result in results:
+        for stage_name, stats in result['stages'].items():
+            total = totals.setdefault(str(result['nr_vertices']), {}).setdefault(stage_name, dict.fromkeys(stats, 0))
+            for key, value in stats.items():
+                total[key] = max(total[key], value) if key == 'peak_bytes' else total[key] + value
+    return totals
+
+
+def compare(report, baseline, threshold):
+    # list of (resolution, stage, seconds, baseline seconds) of the stages that are more than threshold times slower
+    slower = []
+    for resolution, stages in report['totals'].items():
+        for stage_name, stats in stages.items():
+            reference = baseline.get('totals', {}).get(resolution, {}).get(stage_name)
+            if reference is None or reference['seconds'] < min_seconds:
+                continue
+            if stats['seconds'] > threshold * reference['seconds']:
+                slower.append((resolution, stage_name, stats['seconds'], reference['seconds']))
+    return slower
+
+
+def print_totals(totals):
+    for resolution, stages in totals.items():
+        print(f'nr_vertices = {resolution}')
+        for stage_name, stats in sorted(stages.items(), key=lambda item: -item[1]['seconds']):
+            print(f"  {stage_name:30s} {stats['calls']:6d} calls {1000 * stats['seconds']:10.2f} ms {stats['peak_bytes'] / 2 ** 20:8.2f} MB "
+                  f"{stats['faces']:9d} faces {stats['operator_calls']:6d} ops")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Stage-level benchmark of the electrode generator.')
+    parser.add_argument('spec_file', nargs='?', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'elspec.json'),
+                        help='electrode specification (.json), default: elspec.json')
+    parser.add_argument('-e', '--electrodes', nargs='+', help='electrode names (default: all)')
+    parser.add_argument('-r', '--resolution', type=int, nargs='+', default=[16, 36, 72, 144], help='values of nr_vertices to benchmark')
+    parser.add_argument('-m', '--mode', choices=MODES, default='engine',
+                        help='engine: numpy engine without Blender, geometry or operators: build_mode of create_electrode_model (in Blender)')
+    parser.add_argument('-n', '--repeats', type=int, default=5, help='runs per electrode and resolution, the median is kept')
+    parser.add_argument('-o', '--output', default='benchmark.json', help='file for the results')
+    parser.add_argument('--compare', metavar='BASELINE', help='results of an earlier run to compare with')
+    parser.add_argument('--threshold', type=float, default=1.25, help='stages slower than threshold * baseline are reported as regressions')
+    args = parser.parse_args(argv)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline.get('mode', 'engine') != args.mode:
+            parser.error(f"{args.compare} was measured with --mode {baseline.get('mode', 'engine')}")
+
+    elspecs = electrode_catalog.ElectrodeCatalog(args.spec_file)
+    names = args.electrodes or list(elspecs)
+    try:
+        mode = build_function(args.mode)
+    except ImportError:
+        parser.error(f'--mode {args.mode} has to run in Blender: blender -b --python benchmark.py -- --mode {args.mode}')
+
+    results = []
+    for nr_vertices in args.resolution:
+        for name in names:
+            result = benchmark_electrode(name, elspecs[name], nr_vertices, args.repeats, mode)
+            results.append(result)
+            print(f"{name} ({nr_vertices}): {1000 * result['seconds']:.2f} ms, {result['faces']} faces")
+
+    report = {'spec_file': os.path.abspath(args.spec_file), 'generator_version': electrode_geometry.GENERATOR_VERSION,
+              'python': platform.python_version(), 'numpy': np.__version__, 'machine': platform.machine(),
+              'mode': args.mode, 'repeats': args.repeats, 'totals': stage_totals(results), 'results': results}
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print_totals(report['totals'])
+
+    if baseline is not None:
+        slower = compare(report, baseline, args.threshold)
+        for resolution, stage_name, seconds, reference in slower:
+            print(f'slower: {stage_name} at nr_vertices = {resolution}: {1000 * seconds:.2f} ms (baseline {1000 * reference:.2f} ms)')
+        if slower:
+            return 1
+        print(f'no stage is more than {args.threshold} times slower than {args.compare}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[sys.argv.index('--') + 1:] if '--' in sys.argv else None))
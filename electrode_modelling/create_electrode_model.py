@@ -1,35 +1,168 @@
-import json
+import contextlib
+import hashlib
 import bpy
 import os
+import sys
 import math
 from os.path import join
 from pathlib import Path
 import bmesh
+import numpy as np
+
+# helper modules are looked up next to the .blend file and next to this script
+for module_path in (str(Path(__file__).parent.parent), str(Path(__file__).parent)):
+    if module_path not in sys.path:
+        sys.path.append(module_path)
+
+import electrode_builder
+import electrode_catalog
+import electrode_geometry
+import electrode_layout
+import instrumentation
 
 json_filename = join(Path(__file__).parent.parent, 'elspec.json')
+if not os.path.exists(json_filename):  # imported as a module (e.g. by scene_benchmark.py) instead of run from the .blend file
+    json_filename = join(Path(__file__).parent, 'elspec.json')
 model_path = bpy.path.abspath("//")
 
-with open(json_filename) as f:
-    elspecs = json.load(f)
-
 # options
 electrodes = ['example_non_directional_electrode']
-# electrodes = elspecs.keys() # all electrodes present in json sidecar
-nr_vertices = 72  # base number for mesh quality (360 and size of segments should be even dividable for segmented electrodes!)
+# electrodes = get_elspecs().keys() # all electrodes present in json sidecar
+nr_vertices = 72  # base number for mesh quality (borders of segments are snapped to multiples of 360 / nr_vertices)
+build_mode = 'geometry'  # 'geometry': compute the mesh arrays with numpy (fast, no booleans), 'operators': build with bpy.ops (original pipeline)
+chordal_tolerance = None  # maximum deviation (mm) of the tip from a sphere in 'geometry' mode, None: nr_vertices / 4 rings like the UV sphere
+lod_levels = None  # e.g. electrode_geometry.LOD_LEVELS: in 'geometry' mode, also create final_lod<N> objects for these values of nr_vertices
+cache_dir = join(model_path, 'electrode_cache') if model_path else None  # generated meshes are cached here in 'geometry' mode (None disables the cache, unsaved files have no folder)
+cache_size = 256 * 2 ** 20  # maximum size of the cache in bytes, least recently used meshes are removed first
+analytic_normals = True  # in 'geometry' mode, write the exact normals of sphere and cylinders, so a low nr_vertices (e.g. 24) shades like a high one
+keep_components = True  # in 'geometry' mode, also create one object per component (the faces of the final object know their component anyway)
+compare_with_geometry = False  # in 'operators' mode, check the boolean components against the analytic ones of 'geometry' mode (manual check, the analytic ones alone are tested in tests/test_geometry.py)
+trajectory_file = None  # batch file of lead trajectories (.json or .csv, see lead_assembly.py): place all leads as instances instead of building electrodes
+amplitude_file = None  # frames x contacts (.npy or .csv, see stimulation.py): animate the stimulation amplitudes of the contacts of the final object
+max_amplitude = 5.0  # amplitude shown with the full color of the stimulation material
+trace_file = None  # e.g. join(model_path, 'electrode_trace.json'): write a Chrome trace of all stages and bpy.ops calls and print a summary
+
+amplitude_animations = {}  # name of the final object: stimulation.AmplitudeAnimation, written by update_amplitudes on every frame change
+level_meshes = {}  # mesh datablocks of the components in 'geometry' mode, one per distinct component geometry
+elspecs = None  # electrode_catalog.ElectrodeCatalog of json_filename, electrodes are read from the file when they are built
+
+
+# face cleanup rules: (direction of the face normal, minimum face area), a face is deleted if any rule of the set matches
+face_directions = {
+    'up': lambda normal_z: normal_z >= 0.99,
+    'down': lambda normal_z: normal_z <= -0.99,
+    'any': lambda normal_z: np.ones(len(normal_z), dtype=bool),
+}
+tip_sphere_cleanup = (('up', 0.1), ('down', 0.1))  # top face left over after cutting the sphere in half
+tip_cylinder_cleanup = (('down', 0.1),)  # bottom of the tip cylinder
+component_cleanup = (('up', 0.01), ('down', 0.01), ('any', 0.5))  # top and bottom, and the face in the middle of the markers
+last_insulation_cleanup = (('down', 0.01),)  # the last insulation keeps its top
+
+
+def delete_faces(obj, rules):
+    # compute normals and areas of all faces in one pass and delete the matching faces with a single bmesh.ops.delete
+    mesh = obj.data
+    nr_faces = len(mesh.polygons)
+    normals = np.empty(3 * nr_faces, dtype=np.float32)
+    mesh.polygons.foreach_get('normal', normals)
+    areas = np.empty(nr_faces, dtype=np.float32)
+    mesh.polygons.foreach_get('area', areas)
+
+    mask = np.zeros(nr_faces, dtype=bool)
+    for direction, min_area in rules:
+        mask |= face_directions[direction](normals[2::3]) & (areas > min_area)
+
+    bm = bmesh.new()
+    bm.from_mesh(mesh)
+    bm.faces.ensure_lookup_table()
+    bmesh.ops.delete(bm, geom=[bm.faces[i] for i in np.flatnonzero(mask)], context='FACES')
+    bm.to_mesh(mesh)
+    bm.free()
+    mesh.update()
+
+
+def select_only(objects):
+    # select the given objects, only objects of the build scene are touched (see build_scene)
+    for obj in bpy.context.scene.objects:
+        obj.select_set(False)
+    for obj in objects:
+        obj.select_set(True)
+
+
+@contextlib.contextmanager
+def build_scene():
+    # the operator pipeline runs in an empty temporary scene, so selecting, joining and evaluating never touch the objects
+    # of the open file and the build time does not depend on how many objects it holds
+    # the components and final collections are moved to the scene of the user afterwards
+    scene = bpy.context.scene
+    build = bpy.data.scenes.new('electrode_build')
+    window = bpy.context.window
+    try:
+        if window is not None:
+            window.scene = build
+            try:
+                yield build
+            finally:
+                window.scene = scene
+        elif hasattr(bpy.context, 'temp_override'):  # background mode (Blender 3.2+)
+            with bpy.context.temp_override(scene=build, view_layer=build.view_layers[0]):
+                yield build
+        else:  # older versions without a window: build in the scene of the user
+            yield scene
+        for collection in list(build.collection.children):
+            build.collection.children.unlink(collection)
+            scene.collection.children.link(collection)
+    finally:
+        bpy.data.scenes.remove(build)
+
+
+def merge_doubles(obj, distance):
+    # merge vertices of the coincident rings left by joining, with electrode_geometry.merge_vertices
+    # instead of bpy.ops.mesh.remove_doubles (no edit mode needed)
+    mesh = obj.data
+    vertices = np.empty(3 * len(mesh.vertices), dtype=np.float64)
+    mesh.vertices.foreach_get('co', vertices)
+    index, _ = electrode_geometry.merge_vertices(vertices.reshape(-1, 3), distance)
+    _, first = np.unique(index, return_index=True)
+    target = first[index]
+    merged = np.nonzero(target != np.arange(len(target)))[0]
+    if not len(merged):
+        return
+
+    bm = bmesh.new()
+    bm.from_mesh(mesh)
+    bm.verts.ensure_lookup_table()
+    bmesh.ops.weld_verts(bm, targetmap={bm.verts[i]: bm.verts[j] for i, j in zip(merged.tolist(), target[merged].tolist())})
+    bm.to_mesh(mesh)
+    bm.free()
+    mesh.update()
+
+
+class OperatorBuild:
+    # state of one electrode built with the operator pipeline, passed to its create_* functions
+
+    def __init__(self, elspec_electrode, resolution):
+        self.nr_vertices = resolution
+        self.radius_lead = elspec_electrode['lead_diameter'] / 2  # radius of the lead
+        self.radius_inner = self.radius_lead / 2  # inner radius
+        self.total_length = elspec_electrode['lead_length']
+        self.insulation_components = []
+        self.contact_components = []
 
 
-def create_tip(z, tip_length, isContact):
+@instrumentation.stage('create_tip')
+def create_tip(build, z, tip_length, isContact):
     # create sphere for tip
-    bpy.ops.mesh.primitive_uv_sphere_add(segments=nr_vertices, radius=radius_lead, enter_editmode=False, align='WORLD',
-                                         location=(0, 0, z + radius_lead), scale=(1, 1, 1), ring_count=nr_vertices / 2)  # create sphere
+    bpy.ops.mesh.primitive_uv_sphere_add(segments=build.nr_vertices, radius=build.radius_lead, enter_editmode=False, align='WORLD',
+                                         location=(0, 0, z + build.radius_lead), scale=(1, 1, 1), ring_count=build.nr_vertices / 2)  # create sphere
     tip_sphere = bpy.context.object
     tip_sphere.name = 'tip_sphere'
 
     # add cylinder that cuts sphere into half-sphere
-    cut_cyl_depth = radius_lead + 0.2 * radius_lead
-    bpy.ops.mesh.primitive_cylinder_add(vertices=nr_vertices, radius=radius_lead,
+    cut_cyl_depth = build.radius_lead + 0.2 * build.radius_lead
+    bpy.ops.mesh.primitive_cylinder_add(vertices=build.nr_vertices, radius=build.radius_lead,
                                         depth=cut_cyl_depth, enter_editmode=False,
-                                        align='WORLD', location=(0, 0, z + (cut_cyl_depth / 2) + radius_lead), scale=(1, 1, 1))
+                                        align='WORLD', location=(0, 0, z + (cut_cyl_depth / 2) + build.radius_lead), scale=(1, 1, 1))
 
     cut_cyl = bpy.context.object
     cut_cyl.name = 'cut_cylinder'
@@ -42,225 +175,118 @@ def create_tip(z, tip_length, isContact):
     diff_bool.object = cut_cyl
 
     # apply the modifier
-    bpy.context.view_layer.objects.active = bpy.data.objects['tip_sphere']  # make sphere tip active objects
+    bpy.context.view_layer.objects.active = tip_sphere  # make sphere tip active objects
     bpy.ops.object.modifier_apply(modifier="remove_half_sphere")  # cut
 
     # remove top face of sphere
-    bpy.ops.object.select_all(action='DESELECT')
-    tip_sphere.select_set(True)
-    bpy.ops.object.editmode_toggle()
-    bpy.ops.mesh.select_all(action='DESELECT')
-    bm = bmesh.from_edit_mesh(tip_sphere.data)
-    bm.faces.ensure_lookup_table()
-    #
-    #    # iterate through all faces, delete the ones that are facing up- or downwards and have a minimum area (to not delete bottom of tip)
-    for f in bm.faces:
-        if (f.normal[2] <= -0.99 or f.normal[2] >= 0.99) and f.calc_area() > 0.1:
-            f.select = True
-            bpy.ops.mesh.delete(type='FACE')
-
-    bpy.ops.object.editmode_toggle()
-
-    bpy.ops.object.select_all(action='DESELECT')
+    delete_faces(tip_sphere, tip_sphere_cleanup)
 
     # remove cut cyl
-    bpy.data.objects['cut_cylinder'].select_set(True)
-    bpy.ops.object.delete()
+    bpy.data.objects.remove(cut_cyl, do_unlink=True)
 
     # add cylinder to finish tip
-    tip_spacer_depth = tip_length - radius_lead
-    bpy.ops.mesh.primitive_cylinder_add(vertices=nr_vertices, radius=radius_lead,
+    tip_spacer_depth = tip_length - build.radius_lead
+    bpy.ops.mesh.primitive_cylinder_add(vertices=build.nr_vertices, radius=build.radius_lead,
                                         depth=tip_spacer_depth, enter_editmode=False,
-                                        align='WORLD', location=(0, 0, z + (tip_spacer_depth / 2) + radius_lead), scale=(1, 1, 1))
+                                        align='WORLD', location=(0, 0, z + (tip_spacer_depth / 2) + build.radius_lead), scale=(1, 1, 1))
 
     # Get the cylinder object and rename it.
     tip_cyl = bpy.context.object
     tip_cyl.name = 'tip_cylinder'
 
     # remove bottom of cylinder
-    bpy.ops.object.select_all(action='DESELECT')
-    tip_cyl.select_set(True)
-    bpy.ops.object.editmode_toggle()
-    bpy.ops.mesh.select_all(action='DESELECT')
-    bm = bmesh.from_edit_mesh(tip_cyl.data)
-    bm.faces.ensure_lookup_table()
-    #
-    #    # iterate through all faces, delete the ones that are facing up- or downwards and have a minimum area (to not delete bottom of tip)
-    for f in bm.faces:
-        if f.normal[2] <= -0.99 and f.calc_area() > 0.1:
-            f.select = True
-            bpy.ops.mesh.delete(type='FACE')
-
-    bpy.ops.object.editmode_toggle()
-
-    bpy.ops.object.select_all(action='DESELECT')
-
-    mesh = [m for m in bpy.context.scene.objects if m.type == 'MESH']
-
-    for obj in mesh:
-        obj.select_set(state=True)
-        bpy.context.view_layer.objects.active = obj
+    delete_faces(tip_cyl, tip_cylinder_cleanup)
 
+    # join the half sphere into the cylinder (and nothing else of the scene)
+    select_only([tip_sphere, tip_cyl])
+    bpy.context.view_layer.objects.active = tip_cyl
     bpy.ops.object.join()
-
-    bpy.ops.object.editmode_toggle()
-    bpy.ops.mesh.select_all(action='SELECT')
-    bpy.ops.mesh.remove_doubles()
-    bpy.ops.object.editmode_toggle()
+    merge_doubles(tip_cyl, 0.0001)
 
     if isContact:
-        contact_components.append(tip_cyl)
+        build.contact_components.append(tip_cyl)
         tip_cyl.name = 'con0'
     else:
-        insulation_components.append(tip_cyl)
+        build.insulation_components.append(tip_cyl)
         tip_cyl.name = 'ins0'
 
     bpy.data.collections['components'].objects.link(tip_cyl)  # link to components collection
     bpy.context.scene.collection.objects.unlink(tip_cyl)  # unlink from master collection
 
 
-def create_contact(z=0, contact_length=1.5, contact_nr=0, ins_nr=0, segmented=0, num_segments=3, size_segments=90):
+@instrumentation.stage(lambda *args, **kwargs: 'create_contact (segmented)' if kwargs.get('segmented') else 'create_contact (ring)')
+def create_contact(build, z=0, contact_length=1.5, contact_nr=0, ins_nr=0, segmented=0, sectors=()):
     if not segmented:
         # circular contacts
-        bpy.ops.mesh.primitive_cylinder_add(vertices=nr_vertices, radius=radius_lead, depth=contact_length, enter_editmode=False,
+        bpy.ops.mesh.primitive_cylinder_add(vertices=build.nr_vertices, radius=build.radius_lead, depth=contact_length, enter_editmode=False,
                                             align='WORLD', location=(0, 0, z + contact_length / 2), scale=(1, 1, 1))
         contact = bpy.context.object
 
         contact.name = 'con' + str(contact_nr)
 
-        contact_components.append(contact)
+        build.contact_components.append(contact)
         bpy.data.collections['components'].objects.link(contact)  # link to components collection
         bpy.context.scene.collection.objects.unlink(contact)  # unlink from master collection
     else:
-
-        # for good mesh creation of segmented contacts and insulations, we always have to create them with 0 angle and then rotate
-        rot_angle = 40
-        size_insulations = (360 - num_segments * size_segments) / num_segments
-
-        for nrSegm in range(num_segments):
-            # add segmented contact
-            bpy.ops.curve.simple(align='WORLD', location=(0, 0, z), rotation=(0, 0, 0), Simple_Type='Sector', Simple_radius=radius_lead, use_cyclic_u=False, edit_mode=False, Simple_startangle=0, Simple_endangle=size_segments, outputType='POLY',
-                                 Simple_sides=round(nr_vertices * size_segments / 360) - 1)
-            contact = bpy.context.object
-            contact.name = 'con' + str(contact_nr)
-            contact_components.append(contact)
-            bpy.data.collections['components'].objects.link(contact)  # link to components collection
-            bpy.context.scene.collection.objects.unlink(contact)
-            contact_nr = contact_nr + 1
-
-            # rotate
-            contact.rotation_euler[2] = math.radians(rot_angle)
-            rot_angle = rot_angle + size_segments
-
-            # convert it to mesh
-            # bpy.ops.object.editmode_toggle()
-            bpy.ops.object.convert(target='MESH')
-
-            # add edge between vertices to complete segment
-            bpy.ops.object.editmode_toggle()
-            bpy.ops.mesh.select_all(action='DESELECT')
-            # iterate through all faces, delete the ones that are facing up- or downwards and have a minimum area (to not delete bottom of tip)
-            bm = bmesh.from_edit_mesh(contact.data)
-            bm.verts.ensure_lookup_table()
-            bm.verts[0].select_set(True)
-            bm.verts[len(bm.verts) - 1].select_set(True)
-            bpy.ops.mesh.edge_face_add()
-            bpy.ops.mesh.select_all(action='SELECT')
-            bpy.ops.mesh.edge_face_add()
-
-            # extrude it
-            # bpy.ops.object.editmode_toggle()
-            bpy.ops.mesh.select_all(action='SELECT')
-            bpy.ops.mesh.extrude_region_move(MESH_OT_extrude_region={"use_normal_flip": False, "use_dissolve_ortho_edges": True,
-                                                                     "mirror": False}, TRANSFORM_OT_translate={"value": (0, 0, contact_length),
-                                                                                                               "orient_type": 'NORMAL', "orient_matrix": ((0.707107, 0.707107, -0), (-0.707107, 0.707107, 0), (0, 0, 1)),
-                                                                                                               "orient_matrix_type": 'NORMAL', "constraint_axis": (True, True, True), "mirror": False, "use_proportional_edit": False,
-                                                                                                               "proportional_edit_falloff": 'SMOOTH',
-                                                                                                               "proportional_size": 1, "use_proportional_connected": False,
-                                                                                                               "use_proportional_projected": False, "snap": False, "snap_target": 'CLOSEST',
-                                                                                                               "snap_point": (0, 0, 0), "snap_align": False, "snap_normal": (0, 0, 0), "gpencil_strokes": False,
-                                                                                                               "cursor_transform": False, "texture_space": False, "remove_on_cancel": False, "release_confirm": False,
-                                                                                                               "use_accurate": False, "use_automerge_and_split": False})
-            bpy.ops.object.editmode_toggle()
-
-            # add segmented insulation
-            bpy.ops.curve.simple(align='WORLD', location=(0, 0, z), rotation=(0, 0, 0), Simple_Type='Sector', Simple_radius=radius_lead, use_cyclic_u=True, edit_mode=False, Simple_startangle=0,
-                                 Simple_endangle=size_insulations, outputType='POLY',
-                                 Simple_sides=round(nr_vertices * size_insulations / 360) - 1)
-            insulation = bpy.context.object
-            insulation.name = 'ins' + str(ins_nr)
-            insulation_components.append(insulation)
-            bpy.data.collections['components'].objects.link(insulation)  # link to components collection
-
-            insulation.rotation_euler[2] = math.radians(rot_angle)
-            rot_angle = rot_angle + size_insulations
-
-            bpy.context.scene.collection.objects.unlink(insulation)
-            ins_nr = ins_nr + 1
-
-            # convert it to mesh
-            bpy.ops.object.convert(target='MESH')
-
-            # add edge between vertices to complete segment
-            bpy.ops.object.editmode_toggle()
-            bpy.ops.mesh.select_all(action='DESELECT')
-            # iterate through all faces, delete the ones that are facing up- or downwards and have a minimum area (to not delete bottom of tip)
-            bm = bmesh.from_edit_mesh(insulation.data)
-            bm.verts.ensure_lookup_table()
-            bm.verts[0].select_set(True)
-            bm.verts[len(bm.verts) - 1].select_set(True)
-            bpy.ops.mesh.edge_face_add()
-            bpy.ops.mesh.select_all(action='SELECT')
-            bpy.ops.mesh.edge_face_add()
-
-            # extrude it
-            bpy.ops.mesh.select_all(action='SELECT')
-            bpy.ops.mesh.extrude_region_move(MESH_OT_extrude_region={"use_normal_flip": False, "use_dissolve_ortho_edges": False,
-                                                                     "mirror": False}, TRANSFORM_OT_translate={"value": (0, 0, contact_length),
-                                                                                                               "orient_type": 'NORMAL', "orient_matrix": ((0.707107, 0.707107, -0), (-0.707107, 0.707107, 0), (0, 0, 1)),
-                                                                                                               "orient_matrix_type": 'NORMAL', "constraint_axis": (True, True, True), "mirror": False, "use_proportional_edit": False,
-                                                                                                               "proportional_edit_falloff": 'SMOOTH',
-                                                                                                               "proportional_size": 1, "use_proportional_connected": False,
-                                                                                                               "use_proportional_projected": False, "snap": False, "snap_target": 'CLOSEST',
-                                                                                                               "snap_point": (0, 0, 0), "snap_align": False, "snap_normal": (0, 0, 0), "gpencil_strokes": False,
-                                                                                                               "cursor_transform": False, "texture_space": False, "remove_on_cancel": False, "release_confirm": False,
-                                                                                                               "use_accurate": False, "use_automerge_and_split": False})
-            bpy.ops.object.editmode_toggle()
-
-
-def create_insulation(z, insulation_nr, depth):
-    bpy.ops.mesh.primitive_cylinder_add(vertices=nr_vertices, radius=radius_lead, depth=depth, enter_editmode=False, align='WORLD', location=(0, 0, z + depth / 2), scale=(1, 1, 1))
+        # segments and insulations of the level (sectors: alternating (start, end) angles, segment first) are computed together
+        # by the geometry engine on the grid of nr_vertices, so any number and size of segments works
+        solids = electrode_geometry.sector_solids(0, build.radius_lead, contact_length, sectors, build.nr_vertices)
+        for nr_sector, (vertices, faces) in enumerate(solids):
+            if nr_sector % 2 == 0:
+                name, components = 'con' + str(contact_nr + nr_sector // 2), build.contact_components
+            else:
+                name, components = 'ins' + str(ins_nr + nr_sector // 2), build.insulation_components
+
+            # no materials yet (remove_inner_apply_materials adds them), coplanar triangles are dissolved into the n-gons of
+            # the caps that the face cleanup expects
+            mesh = fill_mesh(bpy.data.meshes.new(name), electrode_geometry.MeshData(vertices, faces, np.zeros(len(faces))), materials=False)
+            bm = bmesh.new()
+            bm.from_mesh(mesh)
+            bmesh.ops.dissolve_limit(bm, angle_limit=1e-3, verts=bm.verts, edges=bm.edges)
+            bm.to_mesh(mesh)
+            bm.free()
+
+            sector = bpy.data.objects.new(name, mesh)
+            sector.location = (0, 0, z)
+            components.append(sector)
+            bpy.data.collections['components'].objects.link(sector)  # link to components collection
+
+
+@instrumentation.stage('create_insulation')
+def create_insulation(build, z, insulation_nr, depth):
+    bpy.ops.mesh.primitive_cylinder_add(vertices=build.nr_vertices, radius=build.radius_lead, depth=depth, enter_editmode=False, align='WORLD', location=(0, 0, z + depth / 2), scale=(1, 1, 1))
     insulation = bpy.context.object
 
     insulation.name = 'ins' + str(insulation_nr)
 
-    insulation_components.append(insulation)
+    build.insulation_components.append(insulation)
     bpy.data.collections['components'].objects.link(insulation)  # link to components collection
     bpy.context.scene.collection.objects.unlink(insulation)
 
 
-def create_marker(z=0, contact_length=0, contact_nr=0, insulation_nr=0, insulation_size=0, insulation_startangle=0):
+@instrumentation.stage('create_marker')
+def create_marker(build, z=0, contact_length=0, contact_nr=0, insulation_nr=0, insulation_size=0, insulation_startangle=0):
     offset = 0.2
     # first create contact
-    bpy.ops.mesh.primitive_cylinder_add(vertices=nr_vertices, radius=radius_lead, depth=contact_length, enter_editmode=False,
+    bpy.ops.mesh.primitive_cylinder_add(vertices=build.nr_vertices, radius=build.radius_lead, depth=contact_length, enter_editmode=False,
                                         align='WORLD', location=(0, 0, z + contact_length / 2), scale=(1, 1, 1))
     contact = bpy.context.object
 
     contact.name = 'con' + str(contact_nr)
 
-    contact_components.append(contact)
+    build.contact_components.append(contact)
     bpy.data.collections['components'].objects.link(contact)  # link to components collection
     bpy.context.scene.collection.objects.unlink(contact)  # unlink from master collection
 
     # now create segmented insulation
 
-    bpy.ops.curve.simple(align='WORLD', location=(0, 0, z + offset), rotation=(0, 0, 0), Simple_Type='Sector', Simple_radius=radius_lead, use_cyclic_u=True, edit_mode=False, Simple_startangle=0,
+    bpy.ops.curve.simple(align='WORLD', location=(0, 0, z + offset), rotation=(0, 0, 0), Simple_Type='Sector', Simple_radius=build.radius_lead, use_cyclic_u=True, edit_mode=False, Simple_startangle=0,
                          Simple_endangle=insulation_size + 1e-5, outputType='POLY',
-                         Simple_sides=round(nr_vertices * insulation_size / 360) - 1)
+                         Simple_sides=round(build.nr_vertices * insulation_size / 360) - 1)
     insulation = bpy.context.object
 
     insulation.name = 'ins' + str(insulation_nr)
-    insulation_components.append(insulation)
+    build.insulation_components.append(insulation)
     bpy.data.collections['components'].objects.link(insulation)  # link to components collection
     bpy.context.scene.collection.objects.unlink(insulation)
 
@@ -305,16 +331,17 @@ def create_marker(z=0, contact_length=0, contact_nr=0, insulation_nr=0, insulati
     diff_bool.object = insulation
 
     # apply the modifier
-    bpy.context.view_layer.objects.active = bpy.data.objects['con' + str(contact_nr)]  # make sphere tip active objects
+    bpy.context.view_layer.objects.active = contact  # make marker contact active object
     bpy.ops.object.modifier_apply(modifier="remove_insulation_marker")  # cut
 
-    bpy.ops.object.select_all(action='DESELECT')
+    select_only([])
 
     # reset scale on the marker insulation
     insulation.scale = (1., 1., 1.)
 
 
-def remove_inner_apply_materials(insulation_nr, tip_is_contact):
+@instrumentation.stage('remove_inner_apply_materials')
+def remove_inner_apply_materials(build, insulation_nr, tip_is_contact):
     # before removing the inner part, copy and past all of the components once for final electrode (except inner)
 
     # make new collection for final
@@ -326,13 +353,11 @@ def remove_inner_apply_materials(insulation_nr, tip_is_contact):
     insulation_material = bpy.data.materials.get("insulation")
 
     # assign materials
-    for obj in contact_components:
-        bpy.context.view_layer.objects.active = bpy.data.objects[obj.name]
-        bpy.context.active_object.data.materials.append(contact_material)
+    for obj in build.contact_components:
+        obj.data.materials.append(contact_material)
 
-    for obj in insulation_components:
-        bpy.context.view_layer.objects.active = bpy.data.objects[obj.name]
-        bpy.context.active_object.data.materials.append(insulation_material)
+    for obj in build.insulation_components:
+        obj.data.materials.append(insulation_material)
 
     #    # copy/paste them
     for obj in bpy.data.collections['components'].all_objects:
@@ -340,37 +365,19 @@ def remove_inner_apply_materials(insulation_nr, tip_is_contact):
         if obj.name != "ins_inner":
             new_obj = obj.copy()
             new_obj.data = obj.data.copy()
+            new_obj['component'] = obj.name
             bpy.data.collections['final'].objects.link(new_obj)
 
-            # exclude last insulation from face cleaning
-            bpy.ops.object.select_all(action='DESELECT')
-            new_obj.select_set(True)
-            bpy.ops.object.editmode_toggle()
-            bpy.ops.mesh.select_all(action='DESELECT')
-            bm = bmesh.from_edit_mesh(new_obj.data)
-            bm.faces.ensure_lookup_table()
-
-            # iterate through all faces, delete the ones that are facing up- or downwards and have a minimum area (to not delete bottom of tip)
-            for f in bm.faces:
-                if obj.name == 'ins' + str(insulation_nr):  # for last insulation, only remove bottom one
-                    if f.normal[2] <= -0.99 and f.calc_area() > 0.01:
-                        f.select = True
-                        bpy.ops.mesh.delete(type='FACE')
-                else:
-                    if (f.normal[2] <= -0.99 or f.normal[2] >= 0.99) and f.calc_area() > 0.01:  # throw out bottom and top
-                        f.select = True
-                        bpy.ops.mesh.delete(type='FACE')
-                    elif f.calc_area() > 0.5:
-                        f.select = True
-                        bpy.ops.mesh.delete(type='FACE')  # throw out the one in the middle of the markers
-
-            bpy.ops.object.editmode_toggle()
-            new_obj.select_set(False)
+            # exclude last insulation from face cleaning (only its bottom is removed)
+            if obj.name == 'ins' + str(insulation_nr):
+                delete_faces(new_obj, last_insulation_cleanup)
+            else:
+                delete_faces(new_obj, component_cleanup)
 
     # cut out inner
-    bpy.ops.mesh.primitive_cylinder_add(vertices=nr_vertices, radius=radius_inner, depth=total_length - radius_lead / 3,
+    bpy.ops.mesh.primitive_cylinder_add(vertices=build.nr_vertices, radius=build.radius_inner, depth=build.total_length - build.radius_lead / 3,
                                         enter_editmode=False, align='WORLD', location=(0, 0,
-                                                                                       total_length / 2 + radius_lead / 6), scale=(1, 1, 1))
+                                                                                       build.total_length / 2 + build.radius_lead / 6), scale=(1, 1, 1))
 
     # Get the cylinder object and rename it.
     cyl_inner = bpy.context.object
@@ -378,7 +385,7 @@ def remove_inner_apply_materials(insulation_nr, tip_is_contact):
     cyl_inner.scale = (1., 1., 1.001)  # increase scale by just a little bit to make sure inner part is cut out properly
 
     #    # add to all objects the difference modifier
-    for obj in contact_components:
+    for obj in build.contact_components:
         obj.select_set(True)
         diff_bool = obj.modifiers.new('remove_inner_part', 'BOOLEAN')
         # Set the mode of the modifier to DIFFERENCE.
@@ -387,166 +394,479 @@ def remove_inner_apply_materials(insulation_nr, tip_is_contact):
         diff_bool.use_self = True
         # Set the object to be used by the modifier.
         diff_bool.object = cyl_inner
-        bpy.context.view_layer.objects.active = bpy.data.objects[obj.name]
+        bpy.context.view_layer.objects.active = obj
         bpy.ops.object.modifier_apply(modifier="remove_inner_part")
 
-    for obj in insulation_components:
+    for obj in build.insulation_components:
         diff_bool = obj.modifiers.new('remove_inner_part', 'BOOLEAN')
         # Set the mode of the modifier to DIFFERENCE.
         diff_bool.operation = 'DIFFERENCE'
         diff_bool.solver = 'EXACT'
         # Set the object to be used by the modifier.
         diff_bool.object = cyl_inner
-        bpy.context.view_layer.objects.active = bpy.data.objects[obj.name]
+        bpy.context.view_layer.objects.active = obj
         bpy.ops.object.modifier_apply(modifier="remove_inner_part")
 
     # apply insulation material also to inner part
-    bpy.context.view_layer.objects.active = bpy.data.objects['ins_inner']
-    bpy.context.active_object.data.materials.append(insulation_material)
+    cyl_inner.data.materials.append(insulation_material)
 
-    insulation_components.append(cyl_inner)
+    build.insulation_components.append(cyl_inner)
     bpy.data.collections['components'].objects.link(cyl_inner)  # link to components collection
     bpy.context.scene.collection.objects.unlink(cyl_inner)
 
     cyl_inner.scale = (1., 1., 1.)
 
 
+@instrumentation.stage('fill_mesh')
+def fill_mesh(mesh, mesh_data, materials=True, radius=None):
+    # write the vertex/face arrays of the geometry engine into a mesh with foreach_set, no operators involved
+    nr_faces = len(mesh_data.faces)
+    mesh.clear_geometry()
+    mesh.vertices.add(len(mesh_data.vertices))
+    mesh.vertices.foreach_set('co', mesh_data.vertices.astype(np.float32).ravel())
+    mesh.loops.add(3 * nr_faces)
+    mesh.loops.foreach_set('vertex_index', mesh_data.faces.astype(np.int32).ravel())
+    mesh.polygons.add(nr_faces)
+    mesh.polygons.foreach_set('loop_start', np.arange(0, 3 * nr_faces, 3, dtype=np.int32))
+    mesh.polygons.foreach_set('loop_total', np.full(nr_faces, 3, dtype=np.int32))
+    mesh.polygons.foreach_set('material_index', mesh_data.material_index.astype(np.int32))
+    mesh.update(calc_edges=True)
+
+    # same slot order as electrode_geometry.CONTACT / electrode_geometry.INSULATION
+    if materials and not mesh.materials:
+        mesh.materials.append(bpy.data.materials.get("contact"))
+        mesh.materials.append(bpy.data.materials.get("insulation"))
+
+    if radius is not None and analytic_normals:
+        write_normals(mesh, mesh_data, radius)
+    return mesh
+
+
+def write_normals(mesh, mesh_data, radius):
+    # analytic normals of the geometry engine as custom split normals (one per loop, the loops of fill_mesh are the face
+    # corners), with sharp edges at the borders of components and where the surface has a crease
+    normals = electrode_geometry.loop_normals(mesh_data, radius)
+    sharp = electrode_geometry.sharp_edges(mesh_data, normals)
+
+    edges = np.empty(2 * len(mesh.edges), dtype=np.int32)
+    mesh.edges.foreach_get('vertices', edges)
+    edges = np.sort(edges.reshape(-1, 2), axis=1).astype(np.int64)
+    size = len(mesh.vertices)
+    use_edge_sharp = np.isin(edges[:, 0] * size + edges[:, 1], sharp[:, 0] * size + sharp[:, 1])
+    mesh.edges.foreach_set('use_edge_sharp', use_edge_sharp)
+
+    mesh.polygons.foreach_set('use_smooth', np.ones(len(mesh.polygons), dtype=bool))
+    if hasattr(mesh, 'use_auto_smooth'):  # custom normals need auto smooth before Blender 4.1
+        mesh.use_auto_smooth = True
+    mesh.normals_split_custom_set(normals.reshape(-1, 3))
+
+
+def write_component_index(mesh, component_index):
+    # integer face attribute 'component', the index of the component (in the 'components' property of the object) of each face
+    attribute = mesh.attributes.get('component') or mesh.attributes.new('component', 'INT', 'FACE')
+    attribute.data.foreach_set('value', np.asarray(component_index, dtype=np.int32))
+
+
+def set_components(obj, mesh_data, names):
+    # component index of every face of a mesh from the geometry engine, and the names and face ranges of its components
+    # (the faces of component i are obj.data.polygons[offsets[i]:offsets[i + 1]])
+    write_component_index(obj.data, mesh_data.component_index)
+    obj['components'] = names
+    obj['face_offsets'] = mesh_data.face_offsets(len(names)).tolist()
+
+
+def component_faces(obj, name):
+    # faces of a component in a final object as a slice of its polygons, without searching the geometry
+    i = list(obj['components']).index(name)
+    if 'face_offsets' in obj:
+        return slice(obj['face_offsets'][i], obj['face_offsets'][i + 1])
+    # joined by the operator pipeline: the faces of a component are not contiguous, use the face attribute instead
+    component_index = np.empty(len(obj.data.polygons), dtype=np.int32)
+    obj.data.attributes['component'].data.foreach_get('value', component_index)
+    return np.flatnonzero(component_index == i)
+
+
+def select_component(obj, name):
+    # select the faces of a single component (e.g. to recolor or measure it)
+    mesh = obj.data
+    select = np.zeros(len(mesh.polygons), dtype=bool)
+    select[component_faces(obj, name)] = True
+    mesh.polygons.foreach_set('select', select)
+
+
+def create_mesh(name, mesh_data, radius=None):
+    return fill_mesh(bpy.data.meshes.new(name), mesh_data, radius=radius)
+
+
+def update_mesh_object(name, mesh_data, collection, radius=None):
+    # refill the mesh of an existing object instead of creating a new one, so materials and settings of the object are kept
+    obj = collection.objects.get(name)
+    if obj is None or obj.type != 'MESH':
+        obj = bpy.data.objects.new(name, create_mesh(name, mesh_data, radius))
+        collection.objects.link(obj)
+    else:
+        fill_mesh(obj.data, mesh_data, radius=radius)
+    return obj
+
+
+def component_fingerprint(component, builder):
+    # everything the mesh of a component depends on, except for its position along the lead
+    key = (builder.spec['lead_diameter'], builder.resolution, builder.chordal_tolerance, analytic_normals, electrode_geometry.GENERATOR_VERSION,
+           electrode_geometry.component_key(component))
+    return hashlib.sha1(repr(key).encode()).hexdigest()
+
+
+def shared_component_mesh(component, part, builder):
+    # components with the same geometry (e.g. all ring contacts of a lead) share one mesh datablock, also across leads
+    key = component_fingerprint(component, builder)
+    mesh = level_meshes.get(key)
+    try:
+        if mesh is not None and mesh.name in bpy.data.meshes:
+            return mesh
+    except ReferenceError:  # mesh was removed from the file in the meantime
+        pass
+    mesh = create_mesh(component['name'], part.translated(-component['z0']), builder.radius)
+    level_meshes[key] = mesh
+    return mesh
+
+
+def get_collection(name):
+    collection = bpy.data.collections.get(name)
+    if collection is None:
+        collection = bpy.data.collections.new(name)
+        bpy.context.scene.collection.children.link(collection)
+    return collection
+
+
+def get_elspecs():
+    # the spec file is read when it is needed, not when this module is imported, and only the electrodes that are used
+    global elspecs
+    if elspecs is None:
+        elspecs = electrode_catalog.ElectrodeCatalog(json_filename)
+    return elspecs
+
+
+def electrode_builder_for(electrode):
+    # builder of an electrode of the spec file with the options of this script
+    return electrode_builder.ElectrodeBuilder(get_elspecs()[electrode], nr_vertices, electrode, chordal_tolerance, cache_dir, cache_size)
+
+
+@instrumentation.stage('create_from_geometry')
+def create_from_geometry(builder):
+    # build components and final electrode from the arrays of the geometry engine
+    # objects of a previous run are updated in place: a component keeps its mesh if its fingerprint did not change and
+    # is only moved to its new z position, components that are not part of the electrode anymore are removed
+    # (unchanged component meshes are not regenerated either, see electrode_geometry.local_component_mesh)
+    final_mesh, parts = builder.build()
+    names = [component['name'] for component, _ in parts]
+
+    # components are linked duplicates of one mesh per distinct geometry, placed with their z offset
+    collection_components = get_collection("components")
+    previous = {obj.name: obj for obj in collection_components.objects}
+    for component, part in parts if keep_components else ():
+        fingerprint = component_fingerprint(component, builder)
+        obj = previous.pop(component['name'], None)
+        if obj is None or obj.type != 'MESH':
+            obj = bpy.data.objects.new(component['name'], shared_component_mesh(component, part, builder))
+            collection_components.objects.link(obj)
+        elif obj.get('fingerprint') != fingerprint:
+            obj.data = shared_component_mesh(component, part, builder)
+            obj.rotation_euler = (0, 0, 0)
+            obj.scale = (1, 1, 1)
+        obj['fingerprint'] = fingerprint
+        obj.location = (0, 0, component['z0'])
+
+    for obj in previous.values():
+        bpy.data.objects.remove(obj, do_unlink=True)
+
+    collection_final = get_collection("final")
+    final = update_mesh_object('final', final_mesh, collection_final, builder.radius)
+    set_components(final, final_mesh, names)
+    report_non_manifold(builder.name, final_mesh)
+
+    if lod_levels:
+        # level of detail chain, tagged with its resolution and hidden until needed
+        for resolution in lod_levels:
+            lod_mesh, _ = builder.with_resolution(resolution, chordal_tolerance).build()
+            lod = update_mesh_object(f'final_lod{resolution}', lod_mesh, collection_final, builder.radius)
+            lod['lod'] = resolution
+            set_components(lod, lod_mesh, names)
+            lod.hide_viewport = True
+            lod.hide_render = True
+    return final
+
+
+def mesh_data_from_object(obj):
+    # triangulated world space arrays of an object, to compare it with the geometry engine
+    mesh = obj.data
+    mesh.calc_loop_triangles()
+    vertices = np.empty(3 * len(mesh.vertices), dtype=np.float32)
+    mesh.vertices.foreach_get('co', vertices)
+    faces = np.empty(3 * len(mesh.loop_triangles), dtype=np.int32)
+    mesh.loop_triangles.foreach_get('vertices', faces)
+    matrix = np.array(obj.matrix_world)
+    vertices = vertices.reshape(-1, 3) @ matrix[:3, :3].T + matrix[:3, 3]
+    return electrode_geometry.MeshData(vertices, faces, np.zeros(len(faces) // 3))
+
+
+def report_non_manifold(name, mesh_data):
+    # the final electrode has to be watertight
+    count = mesh_data.non_manifold_edges()
+    if count:
+        print(f'{name}: final mesh has {count} non-manifold edges')
+    return count
+
+
+@instrumentation.stage('compare_components')
+def compare_components(builder, tolerance=0.02):
+    # compare volume and surface area of the components cut with boolean modifiers with the analytic annular solids
+    bpy.context.view_layer.update()
+    _, parts = electrode_geometry.build_electrode(builder.spec, builder.resolution, builder.name)
+    mismatches = 0
+    for component, part in parts:
+        obj = bpy.data.collections['components'].objects.get(component['name'])
+        if obj is None:
+            print(f"{component['name']}: not found in components")
+            mismatches = mismatches + 1
+            continue
+
+        reference = mesh_data_from_object(obj)
+        for measure in ('volume', 'area'):
+            expected = getattr(reference, measure)()
+            actual = getattr(part, measure)()
+            if abs(actual - expected) > tolerance * abs(expected):
+                print(f"{component['name']}: {measure} {actual:.4f} (analytic) vs. {expected:.4f} (boolean)")
+                mismatches = mismatches + 1
+
+    print(f'{builder.name}: {mismatches} mismatches between analytic and boolean components')
+    return mismatches
+
+
+@instrumentation.stage('create_final')
 def create_final(diameter=1):
-    # deselect all
-    bpy.ops.object.select_all(action='DESELECT')
-
-    for obj in bpy.data.collections['final'].all_objects:
-        obj.select_set(True)
-        bpy.context.view_layer.objects.active = bpy.data.objects[obj.name]
+    # join the copies in the final collection into its last object, the faces keep the index of their component
+    objects = list(bpy.data.collections['final'].all_objects)
+    for i, component in enumerate(objects):
+        write_component_index(component.data, np.full(len(component.data.polygons), i))
+    names = [component.get('component', component.name) for component in objects]
+    obj = objects[-1]
+    select_only(objects)
+    bpy.context.view_layer.objects.active = obj
 
     bpy.ops.object.join()
     obj.name = 'final'
+    obj['components'] = names
 
     # do some additional clean-up afer joining
+    merge_doubles(obj, diameter / 100)
     bpy.ops.object.editmode_toggle()
-    bpy.ops.mesh.select_all(action='SELECT')
-    bpy.ops.mesh.remove_doubles(threshold=diameter / 100)
     bpy.ops.mesh.select_all(action='DESELECT')
     bpy.ops.mesh.select_interior_faces()
     bpy.ops.mesh.delete(type='FACE')
     bpy.ops.object.editmode_toggle()
+    return obj
+
+def remove_electrode():
+    # remove the collections components and final with their objects, and the meshes that are not used anymore
+    meshes = set()
+    for name in ('components', 'final'):
+        collection = bpy.data.collections.get(name)
+        if collection:
+            for obj in list(collection.objects):
+                if obj.type == 'MESH':
+                    meshes.add(obj.data)
+                bpy.data.objects.remove(obj, do_unlink=True)
+            bpy.data.collections.remove(collection)
+    for mesh in meshes:
+        if mesh.users == 0:
+            bpy.data.meshes.remove(mesh)
+
+
+def reset_build_state():
+    # forget everything a later build could reuse (objects and their fingerprints, shared component meshes and the memoized
+    # component arrays), so the next construct_electrode is a cold build, used by the benchmarks
+    remove_electrode()
+    level_meshes.clear()
+    electrode_geometry.clear_cache()
 
-## construct electrode
-for e, electrode in enumerate(electrodes):
-
-    # remove all older objects from components
-    collection = bpy.data.collections.get('components')
 
-    if collection:
-        for obj in collection.objects:
+## construct electrode
+@instrumentation.stage('electrode')
+def construct_electrode(electrode, builder=None, mode=None):
+    # build an electrode of the spec file (or of an electrode_builder.ElectrodeBuilder) in the open file, returns the final object
+    # mode: 'geometry' or 'operators', default: build_mode
+    if builder is None:
+        builder = electrode_builder_for(electrode)
+
+    # spec of current electrode, compiled into a table with one row per component (fails here for malformed specs)
+    elspec_electrode = builder.spec
+    layout = builder.layout()
+
+    if (mode or build_mode) == 'geometry':
+        return create_from_geometry(builder)
+
+    # remove all older objects from components and final
+    remove_electrode()
+
+    # build in a temporary scene of its own, see build_scene
+    with build_scene():
+        # radius, lengths and lists of components of this electrode
+        build = OperatorBuild(elspec_electrode, builder.resolution)
+
+        collection_components = bpy.data.collections.new("components")
+        bpy.context.scene.collection.children.link(collection_components)
+
+        for row in layout.tolist():
+            row = dict(zip(layout.dtype.names, row))  # plain python values for the operators
+            kind = row['kind']
+            z = row['z_start']
+            length = row['z_end'] - row['z_start']
+
+            name = f"con{row['contact_id']}" if row['contact_id'] >= 0 else f"ins{row['insulation_id']}"
+            with instrumentation.annotate(component=name):
+                if kind in (electrode_layout.TIP_CONTACT, electrode_layout.TIP_INSULATION):
+                    create_tip(build, z, length, kind == electrode_layout.TIP_CONTACT)
+                elif kind == electrode_layout.CONTACT:
+                    create_contact(build, z=z, contact_length=length, contact_nr=row['contact_id'])
+                elif kind == electrode_layout.INSULATION:
+                    create_insulation(build, z, row['insulation_id'], length)
+                elif kind == electrode_layout.SEGMENT and row['contact_id'] == layout[(layout['level'] == row['level']) & (layout['kind'] == kind)][0]['contact_id']:
+                    # all segments and insulations of a level are created together (at its first segment)
+                    level = layout[(layout['level'] == row['level']) & np.isin(layout['kind'], (electrode_layout.SEGMENT, electrode_layout.GAP))]
+                    gaps = level[level['kind'] == electrode_layout.GAP]
+                    sectors = [(float(start), float(start + extent)) for start, extent in zip(level['angle_start'], level['angle_extent'])]
+                    create_contact(build, z=z, contact_length=length, contact_nr=row['contact_id'], segmented=1, ins_nr=int(gaps[0]['insulation_id']),
+                                   sectors=sectors)
+                elif kind == electrode_layout.MARKER:
+                    window = layout[layout['kind'] == electrode_layout.WINDOW][0]
+                    create_marker(build, z=z, contact_length=length, contact_nr=row['contact_id'], insulation_nr=int(window['insulation_id']),
+                                  insulation_size=float(window['angle_extent']), insulation_startangle=float(window['angle_start']))
+
+        # the last insulation (at the end of the lead) keeps its top
+        remove_inner_apply_materials(build, int(layout[np.argmax(layout['z_end'])]['insulation_id']), elspec_electrode["tipiscontact"])
+
+        final = create_final(diameter=elspec_electrode['lead_diameter'])
+        bpy.context.view_layer.update()
+        report_non_manifold(builder.name, mesh_data_from_object(final))
+
+        if compare_with_geometry:
+            compare_components(builder)
+    return final
+
+
+@instrumentation.stage('assemble_leads')
+def assemble_leads(path):
+    # every electrode type of the batch file is built once (geometry mode) into a collection that is not part of the scene,
+    # every lead is an empty instancing that collection, so the file holds one mesh per type however many leads there are
+    import lead_assembly  # only needed for trajectory files
+    leads = lead_assembly.assembly(lead_assembly.read_trajectories(path), get_elspecs())
+
+    collection_leads = get_collection('leads')
+    for collection_group in list(collection_leads.children):
+        for obj in list(collection_group.objects):
             bpy.data.objects.remove(obj, do_unlink=True)
-        bpy.data.collections.remove(collection)
-
-    # remove all older objects from final
-    collection = bpy.data.collections.get('final')
+        bpy.data.collections.remove(collection_group)
+
+    for electrode, (names, matrices) in leads.items():
+        builder = electrode_builder_for(electrode)
+        final_mesh, _ = builder.build()
+        collection_type = bpy.data.collections.get('lead_' + electrode) or bpy.data.collections.new('lead_' + electrode)
+        update_mesh_object(electrode, final_mesh, collection_type, builder.radius)
+
+        # all objects of a type are created first, their transforms are then set with a single foreach_set
+        # (blender stores matrices column by column)
+        collection_group = bpy.data.collections.new('leads_' + electrode)
+        collection_leads.children.link(collection_group)
+        for name in names:
+            obj = bpy.data.objects.new(name, None)
+            obj.instance_type = 'COLLECTION'
+            obj.instance_collection = collection_type
+            collection_group.objects.link(obj)
+        collection_group.objects.foreach_set('matrix_world', matrices.transpose(0, 2, 1).astype(np.float32).ravel())
+
+    print(f"placed {sum(len(names) for names, _ in leads.values())} leads of {len(leads)} electrode types")
+
+
+def stimulation_material():
+    # contact material that colors the faces by their 'amplitude' attribute (grey: off, red: max_amplitude)
+    material = bpy.data.materials.get('stimulation')
+    if material is None:
+        material = bpy.data.materials.new('stimulation')
+        material.use_nodes = True
+        nodes = material.node_tree.nodes
+        attribute = nodes.new('ShaderNodeAttribute')
+        attribute.attribute_name = 'amplitude'
+        map_range = nodes.new('ShaderNodeMapRange')
+        map_range.name = 'amplitude_range'
+        ramp = nodes.new('ShaderNodeValToRGB')
+        ramp.color_ramp.elements[0].color = (0.8, 0.8, 0.8, 1)
+        ramp.color_ramp.elements[1].color = (1, 0.05, 0, 1)
+        links = material.node_tree.links
+        links.new(attribute.outputs['Fac'], map_range.inputs['Value'])
+        links.new(map_range.outputs['Result'], ramp.inputs['Fac'])
+        links.new(ramp.outputs['Color'], nodes['Principled BSDF'].inputs['Base Color'])
+    material.node_tree.nodes['amplitude_range'].inputs['From Max'].default_value = max_amplitude
+    return material
+
+
+def write_amplitudes(obj, animation, frame):
+    # one buffer write per lead and frame
+    obj.data.attributes['amplitude'].data.foreach_set('value', animation.face_values(frame))
+    obj.data.update()
+
+
+def update_amplitudes(scene, depsgraph=None):
+    # frame change handler
+    for name, animation in list(amplitude_animations.items()):
+        obj = bpy.data.objects.get(name)
+        if obj is None:
+            del amplitude_animations[name]
+            continue
+        write_amplitudes(obj, animation, scene.frame_current - scene.frame_start)
+
+
+def animate_amplitudes(obj, amplitudes):
+    # amplitudes (frames x contacts) of the contacts of a final object, shown by the stimulation material through the float
+    # face attribute 'amplitude' instead of one material per contact and frame
+    import stimulation  # only needed for amplitude files
+    mesh = obj.data
+    component_index = np.empty(len(mesh.polygons), dtype=np.int32)
+    mesh.attributes['component'].data.foreach_get('value', component_index)
+    animation = stimulation.AmplitudeAnimation(amplitudes, component_index, list(obj['components']))
+    if mesh.attributes.get('amplitude') is None:
+        mesh.attributes.new('amplitude', 'FLOAT', 'FACE')
+
+    # the material is replaced on the object only, other users of the mesh keep the contact material
+    slot = next((slot for slot in obj.material_slots if slot.material and slot.material.name in ('contact', 'stimulation')),
+                obj.material_slots[electrode_geometry.CONTACT])
+    slot.link = 'OBJECT'
+    slot.material = stimulation_material()
+
+    amplitude_animations[obj.name] = animation
+    handlers = bpy.app.handlers.frame_change_pre
+    for handler in [h for h in handlers if getattr(h, '__name__', '') == 'update_amplitudes']:
+        handlers.remove(handler)  # registered by an earlier run of this script
+    handlers.append(update_amplitudes)
+
+    scene = bpy.context.scene
+    scene.frame_end = max(scene.frame_end, scene.frame_start + animation.nr_frames - 1)
+    write_amplitudes(obj, animation, scene.frame_current - scene.frame_start)
+
+
+def main():
+    with instrumentation.tracing(trace_file) if trace_file else contextlib.nullcontext():
+        if trajectory_file:
+            assemble_leads(trajectory_file)
+        else:
+            for electrode in electrodes:
+                with instrumentation.annotate(electrode=electrode):
+                    construct_electrode(electrode)
 
-    if collection:
-        for obj in collection.objects:
-            bpy.data.objects.remove(obj, do_unlink=True)
-        bpy.data.collections.remove(collection)
-
-    # spec of current electrode
-    elspec_electrode = elspecs[electrode]
-
-    # get relevant info
-    radius_lead = elspec_electrode['lead_diameter'] / 2  # radius of the lead
-    radius_inner = radius_lead / 2  # inner radius
-    nr_elements = elspec_electrode['num_level']  # how many elements (one element is either a contact or a group of segmented contacts, the tip is always an element)
-    contact_spacing = elspec_electrode['contact_spacing']  # spacing between contacts (assumed to be not contact specific for now)
-    total_length = elspec_electrode['lead_length']
-
-    # create lists for components and collection
-    insulation_components = []
-    contact_components = []
-    collection_components = bpy.data.collections.new("components")
-    bpy.context.scene.collection.children.link(collection_components)
-
-    z_height = 0  # this value will be increased with each element
-    contact_nr = 0
-    insulation_nr = 0
-
-    for el_nr in range(0, nr_elements):
-
-        if el_nr == 0:
-            # tip
-            create_tip(z_height, elspec_electrode["contact_specification"][str(el_nr)]["length"], elspec_electrode["tipiscontact"])
-
-            if elspec_electrode["tipiscontact"]:
-                z_height = z_height + elspec_electrode["contact_specification"][str(el_nr)]["length"]
-
-                if nr_elements == 1:
-                    final_insulation_depth = total_length - z_height
-                    create_insulation(z_height, insulation_nr, final_insulation_depth)
-                else:
-                    create_insulation(z_height, 0, contact_spacing[el_nr])
-                    z_height = z_height + contact_spacing[el_nr]
-                    contact_nr = contact_nr + 1
-            else:
-                z_height = z_height + elspec_electrode["contact_specification"][str(el_nr)]["length"]
+    if amplitude_file:
+        import stimulation
+        animate_amplitudes(bpy.data.collections['final'].objects['final'], stimulation.read_amplitudes(amplitude_file))
 
-            # if there is more than 1 elements, advance
-            if nr_elements > 1:
-                insulation_nr = insulation_nr + 1
 
-        else:
-            # following contacts
-            if not elspec_electrode["contact_specification"][str(el_nr)]["segmented"]:
-                create_contact(z=z_height, contact_length=elspec_electrode["contact_specification"][str(el_nr)]["length"], contact_nr=contact_nr)
-                contact_nr = contact_nr + 1
-            else:
-                create_contact(z=z_height, contact_length=elspec_electrode["contact_specification"][str(el_nr)]["length"], contact_nr=contact_nr,
-                               segmented=1, ins_nr=insulation_nr,
-                               num_segments=elspec_electrode["contact_specification"][str(el_nr)]["num_segments"],
-                               size_segments=elspec_electrode["contact_specification"][str(el_nr)]["size_segments"])
-
-                contact_nr = contact_nr + 3
-                insulation_nr = insulation_nr + 3
-
-            z_height = z_height + elspec_electrode["contact_specification"][str(el_nr)]["length"]
-
-            if el_nr != len(range(0, nr_elements)) - 1:
-                # if not the last insulation element
-
-                if len(contact_spacing) == 1: # even spacings
-                    create_insulation(z_height, insulation_nr, contact_spacing[0])
-                    z_height = z_height + contact_spacing[0]
-                else:
-                    if elspec_electrode["tipiscontact"]:
-                        create_insulation(z_height, insulation_nr, contact_spacing[el_nr])
-                        z_height = z_height + contact_spacing[el_nr]
-                    else:
-                        create_insulation(z_height, insulation_nr, contact_spacing[el_nr-1])
-                        z_height = z_height + contact_spacing[el_nr-1]
-                insulation_nr = insulation_nr + 1
-            else:
-                # if it is the last insulation element and no marker is present, create a longer one to finish electrode
-                if "marker_pos" not in elspec_electrode:
-                    final_insulation_depth = total_length - z_height
-                    create_insulation(z_height, insulation_nr, final_insulation_depth)
-                else:
-                    # create insulation between last contact and marker
-                    print(insulation_nr)
-                    create_insulation(z_height, insulation_nr, elspec_electrode["marker_pos"] - z_height)
-                    z_height = z_height + elspec_electrode["marker_pos"] - z_height
-                    # now create final insulation until the end of the electrode
-                    final_insulation_depth = total_length - (z_height + elspec_electrode["marker_length"])
-                    create_insulation(z_height + elspec_electrode["marker_length"], insulation_nr + 2, final_insulation_depth)
-
-    if "marker_pos" in elspec_electrode:
-        # create marker if electrode has marker
-        if "B33" in electrode:  # this is for sensight
-            print('Sensight electrodes not implemented yet')
-        else:  # conventional markers can be created on the fly
-            create_marker(z=elspec_electrode["marker_pos"], contact_length=elspec_electrode["marker_length"], contact_nr=contact_nr, insulation_nr=insulation_nr + 1, insulation_size=elspec_electrode["marker_size"],
-                          insulation_startangle=elspec_electrode["marker_startangle"])
-
-        insulation_nr = insulation_nr + 2
-
-    remove_inner_apply_materials(insulation_nr, elspec_electrode["tipiscontact"])
-
-    create_final(diameter=elspec_electrode['lead_diameter'])
+# run from the text editor or with blender --python, importing the module builds nothing
+if __name__ == '__main__':
+    main()
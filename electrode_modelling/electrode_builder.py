@@ -0,0 +1,71 @@
+import threading
+
+import electrode_catalog
+import electrode_geometry
+import electrode_layout
+import mesh_cache
+
+# importable front end of the generator: an ElectrodeBuilder holds the spec, options and results of one electrode at one
+# resolution, nothing is built when this module is imported and nothing is shared between builders except the memoized
+# (read-only) component meshes, so independent builds can run in a thread pool
+# bpy is only imported by to_blender, which writes the electrode into the open Blender file (see create_electrode_model.py)
+#
+#     builder = ElectrodeBuilder.from_file('elspec.json', 'example_directional_electrode', resolution=36)
+#     final, parts = builder.build()
+
+
+class ElectrodeBuilder:
+
+    def __init__(self, spec, resolution=72, name='', chordal_tolerance=None, cache_dir=None, cache_size=256 * 2 ** 20):
+        # spec: specification of one electrode (a value of elspec.json), name: its key in the spec file
+        # chordal_tolerance: see electrode_geometry.tip_rings, cache_dir: see mesh_cache.py (None: no cache)
+        self.spec = spec
+        self.resolution = resolution
+        self.name = name
+        self.chordal_tolerance = chordal_tolerance
+        self.cache_dir = cache_dir
+        self.cache_size = cache_size
+        self.final = None
+        self.parts = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_file(cls, path, name, resolution=72, **options):
+        # only this electrode is parsed, see electrode_catalog.py
+        return cls(electrode_catalog.ElectrodeCatalog(path)[name], resolution, name, **options)
+
+    @property
+    def radius(self):
+        return self.spec['lead_diameter'] / 2
+
+    def layout(self):
+        # one row per component (see electrode_layout.py), raises electrode_layout.SpecError for malformed specs
+        return electrode_layout.compile_layout(self.spec, self.name)
+
+    def with_resolution(self, resolution, chordal_tolerance=None):
+        # builder of the same electrode at another resolution (e.g. a level of detail), the tip is as precise as the
+        # circumference unless chordal_tolerance is given
+        if chordal_tolerance is None:
+            chordal_tolerance = electrode_geometry.chordal_error(self.radius, resolution)
+        return ElectrodeBuilder(self.spec, resolution, self.name, chordal_tolerance, self.cache_dir, self.cache_size)
+
+    def build(self):
+        # final surface and (component, mesh) list of the electrode, see electrode_geometry.build_electrode
+        # built once per builder, later calls return the same meshes
+        with self._lock:
+            if self.final is None:
+                if self.cache_dir:
+                    cache = mesh_cache.MeshCache(self.cache_dir, self.cache_size)
+                    self.final, self.parts = cache.build(self.spec, self.resolution, self.name, self.chordal_tolerance)
+                else:
+                    self.final, self.parts = electrode_geometry.build_electrode(self.spec, self.resolution, self.name,
+                                                                               chordal_tolerance=self.chordal_tolerance)
+        return self.final, self.parts
+
+    def component_names(self):
+        return [component['name'] for component, _ in self.build()[1]]
+
+    def to_blender(self, build_mode='geometry'):
+        # build the electrode in the open Blender file (collections 'components' and 'final'), returns the final object
+        import create_electrode_model  # imports bpy
+        return create_electrode_model.construct_electrode(self.name, self, build_mode)
@@ -0,0 +1,133 @@
+import collections.abc
+import hashlib
+import json
+import os
+import re
+import threading
+
+# read-only view of a spec file (like elspec.json) that parses single electrodes on demand: the byte range and a hash of
+# every electrode are stored in an index file next to the spec file (elspec.json.index), which is built once by scanning
+# the file and rebuilt whenever the size or modification time of the spec file changes
+# so looking up a few electrodes does not depend on the size of the file
+#
+#     elspecs = ElectrodeCatalog('elspec.json')
+#     elspec = elspecs['example_directional_electrode']
+
+INDEX_VERSION = 1
+
+_whitespace = re.compile(r'[ \t\n\r]*')
+
+
+def scan(data):
+    # {name: (start, end)} byte ranges of the values of the top level object of a JSON document (utf-8), every value is
+    # parsed once by the C decoder of the json module to find its end
+    text = data.decode('utf-8')
+    decoder = json.JSONDecoder()
+
+    def skip(i, expected=None):
+        i = _whitespace.match(text, i).end()
+        if expected is not None:
+            if text[i:i + 1] != expected:
+                raise ValueError(f'expected {expected!r} at character {i} of the spec file')
+            i = _whitespace.match(text, i + 1).end()
+        return i
+
+    ranges = {}
+    i = skip(0, '{')
+    while text[i:i + 1] != '}':
+        if ranges:
+            i = skip(i, ',')
+        key, i = decoder.raw_decode(text, i)
+        if not isinstance(key, str):
+            raise ValueError(f'expected a name at character {i} of the spec file')
+        start = skip(i, ':')
+        _, end = decoder.raw_decode(text, start)
+        ranges[key] = (start, end)
+        i = skip(end)
+    if skip(i + 1) != len(text):  # like json.loads, only whitespace may follow the object
+        raise ValueError(f'unexpected data after the object at character {skip(i + 1)} of the spec file')
+
+    if len(text) != len(data):  # non-ASCII characters: character offsets to byte offsets
+        offsets = sorted({offset for span in ranges.values() for offset in span})
+        position = byte = 0
+        to_bytes = {}
+        for offset in offsets:
+            byte += len(text[position:offset].encode('utf-8'))
+            position = offset
+            to_bytes[offset] = byte
+        ranges = {key: (to_bytes[start], to_bytes[end]) for key, (start, end) in ranges.items()}
+    return ranges
+
+
+class ElectrodeCatalog(collections.abc.Mapping):
+
+    def __init__(self, path, index_path=None):
+        self.path = path
+        self.index_path = index_path or path + '.index'
+        self._lock = threading.Lock()
+        self._stat = None
+        self._entries = {}
+        self._specs = {}
+
+    def _file_stat(self):
+        stat = os.stat(self.path)
+        return [stat.st_size, stat.st_mtime_ns]
+
+    def _load_index(self):
+        try:
+            with open(self.index_path) as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return index if index.get('version') == INDEX_VERSION else None
+
+    def _build_index(self, stat):
+        with open(self.path, 'rb') as f:
+            data = f.read()
+        entries = {name: [start, end, hashlib.sha256(data[start:end]).hexdigest()] for name, (start, end) in scan(data).items()}
+        index = {'version': INDEX_VERSION, 'stat': stat, 'entries': entries}
+
+        # written to a temporary file first, so other processes never read half-written indices
+        tmp_path = f'{self.index_path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(index, f)
+            os.replace(tmp_path, self.index_path)
+        except OSError:  # read-only folder, the index is only kept in memory
+            pass
+        return index
+
+    def _index(self):
+        # entries of the current version of the spec file, the index is reloaded (or rebuilt) when the file changed
+        stat = self._file_stat()
+        with self._lock:
+            if stat != self._stat:
+                index = self._load_index()
+                if index is None or index['stat'] != stat:
+                    index = self._build_index(stat)
+                self._stat, self._entries, self._specs = stat, index['entries'], {}
+            return self._entries
+
+    def __getitem__(self, name):
+        entries = self._index()
+        spec = self._specs.get(name)
+        if spec is None:
+            start, end, _ = entries[name]
+            with open(self.path, 'rb') as f:
+                f.seek(start)
+                spec = json.loads(f.read(end - start))
+            self._specs[name] = spec
+        return spec
+
+    def __iter__(self):
+        return iter(self._index())
+
+    def __len__(self):
+        return len(self._index())
+
+    def __contains__(self, name):
+        return name in self._index()
+
+    def spec_hash(self, name):
+        # sha256 of the text of an electrode in the spec file, changes whenever its specification is edited
+        return self._index()[name][2]
@@ -0,0 +1,602 @@
+import functools
+import math
+
+import numpy as np
+
+import electrode_layout
+from instrumentation import annotate, stage
+
+GENERATOR_VERSION = 5  # increase whenever the generated geometry changes (invalidates cached meshes)
+
+# material indices of the generated faces (same slot order as the materials appended in create_electrode_model.py)
+CONTACT = 0
+INSULATION = 1
+
+LOD_LEVELS = (16, 32, 72, 144)  # values of nr_vertices of the level of detail chain
+bore_start = 1 / 3  # the inner bore starts at this fraction of the lead radius above the tip (same as ins_inner)
+
+
+class MeshData:
+    # plain vertex/face/material arrays, faces are triangles with outward (counter-clockwise) winding
+    # component_index holds the index of the component (contact or insulation) each face belongs to
+
+    def __init__(self, vertices, faces, material_index, component_index=None):
+        self.vertices = np.asarray(vertices, dtype=np.float64).reshape(-1, 3)
+        self.faces = np.asarray(faces, dtype=np.int32).reshape(-1, 3)
+        self.material_index = np.asarray(material_index, dtype=np.int32).reshape(-1)
+        if component_index is None:
+            component_index = np.zeros(len(self.faces))
+        self.component_index = np.asarray(component_index, dtype=np.int32).reshape(-1)
+
+    def translated(self, dz):
+        vertices = self.vertices.copy()
+        vertices[:, 2] += dz
+        return MeshData(vertices, self.faces, self.material_index, self.component_index)
+
+    @staticmethod
+    def concatenate(meshes, component_index=None):
+        # component_index: one index per mesh that replaces the component index of its faces
+        meshes = list(meshes)
+        offsets = np.cumsum([0] + [len(m.vertices) for m in meshes])
+        vertices = np.concatenate([m.vertices for m in meshes]) if meshes else np.zeros((0, 3))
+        faces = np.concatenate([m.faces + o for m, o in zip(meshes, offsets)]) if meshes else np.zeros((0, 3))
+        material_index = np.concatenate([m.material_index for m in meshes]) if meshes else np.zeros(0)
+        if component_index is None:
+            component_index = np.concatenate([m.component_index for m in meshes]) if meshes else np.zeros(0)
+        else:
+            component_index = np.repeat(component_index, [len(m.faces) for m in meshes])
+        return MeshData(vertices, faces, material_index, component_index)
+
+    def sorted_by_component(self):
+        # same mesh with the faces of each component next to each other (in the order of the components)
+        order = np.argsort(self.component_index, kind='stable')
+        return MeshData(self.vertices, self.faces[order], self.material_index[order], self.component_index[order])
+
+    def face_offsets(self, nr_components=None):
+        # faces of component i are faces[offsets[i]:offsets[i + 1]], only for meshes sorted by component
+        counts = np.bincount(self.component_index, minlength=nr_components or 0)
+        return np.concatenate(([0], np.cumsum(counts))).astype(np.int64)
+
+    def component(self, i, offsets=None):
+        # faces of a single component (a slice of a sorted mesh, all vertices are kept)
+        offsets = self.face_offsets() if offsets is None else offsets
+        faces = slice(offsets[i], offsets[i + 1])
+        return MeshData(self.vertices, self.faces[faces], self.material_index[faces], self.component_index[faces])
+
+    def volume(self):
+        # enclosed volume (divergence theorem), only meaningful for closed meshes
+        v = self.vertices[self.faces]
+        return np.einsum('ij,ij->i', v[:, 0], np.cross(v[:, 1], v[:, 2])).sum() / 6
+
+    def area(self):
+        v = self.vertices[self.faces]
+        return np.linalg.norm(np.cross(v[:, 1] - v[:, 0], v[:, 2] - v[:, 0]), axis=1).sum() / 2
+
+    def non_manifold_edges(self):
+        # number of edges that are not shared by exactly two faces with opposite directions (0 for a watertight mesh)
+        # edges as one integer (start * nr_vertices + end), much faster to sort than rows
+        n = len(self.vertices)
+        faces = self.faces.astype(np.int64)
+        directed, counts = np.unique(faces.ravel() * n + faces[:, [1, 2, 0]].ravel(), return_counts=True)
+        start, end = np.divmod(directed, n)
+        _, undirected_counts = np.unique(np.minimum(start, end) * n + np.maximum(start, end), return_counts=True)
+        return int((counts > 1).sum() + (undirected_counts != 2).sum())
+
+
+def _circle(nr_vertices):
+    return np.arange(nr_vertices) * (2 * math.pi / nr_vertices)
+
+
+def _arc(start_angle, end_angle, nr_vertices):
+    # angles (in rad) of an arc given in degrees, with about the same angular resolution as a full circle
+    sides = max(1, round(nr_vertices * (end_angle - start_angle) / 360))
+    return np.radians(np.linspace(start_angle, end_angle, sides + 1))
+
+
+def _triangulate(quads):
+    # split quads (a, b, c, d) into (a, b, c) and (a, c, d) and drop triangles collapsed on the axis
+    quads = np.asarray(quads).reshape(-1, 4)
+    tris = np.concatenate((quads[:, [0, 1, 2]], quads[:, [0, 2, 3]]))
+    valid = (tris[:, 0] != tris[:, 1]) & (tris[:, 1] != tris[:, 2]) & (tris[:, 0] != tris[:, 2])
+    return tris[valid]
+
+
+def _compact(vertices, faces):
+    # remove vertices that are not referenced by any face
+    used, faces = np.unique(faces, return_inverse=True)
+    return vertices[used], faces.reshape(-1, 3)
+
+
+def _revolve(rho, z, thetas):
+    # surface of revolution of the profile (rho, z) around the z-axis, profile points with rho == 0 collapse to a pole
+    # walking along the profile, the outside of the surface is on the right hand side (upwards on the outer wall)
+    rho = np.asarray(rho, dtype=np.float64)
+    z = np.asarray(z, dtype=np.float64)
+    nt = len(thetas)
+    tt, rr = np.meshgrid(thetas, rho)
+    vertices = np.column_stack(((rr * np.cos(tt)).ravel(), (rr * np.sin(tt)).ravel(), np.repeat(z, nt)))
+
+    idx = np.arange(len(rho) * nt).reshape(len(rho), nt)
+    idx[rho == 0] = idx[rho == 0][:, :1]  # poles use the first vertex of their row only
+
+    nxt = np.roll(idx, -1, axis=1)
+    quads = np.stack((idx[:-1], nxt[:-1], nxt[1:], idx[1:]), axis=-1)
+    return _compact(vertices, _triangulate(quads))
+
+
+def _cell_solid(r_inner, r_outer, z_edges, thetas, occupied, closed, outer_only=False):
+    # boundary of a union of cells of a cylindrical grid (one radial band between r_inner and r_outer, z bands and angular columns)
+    # occupied has shape (len(z_edges) - 1, number of columns), r_inner = 0 gives a solid without bore
+    z_edges = np.asarray(z_edges, dtype=np.float64)
+    nz, nt = len(z_edges), len(thetas)
+    ncols = nt if closed else nt - 1
+    occupied = np.asarray(occupied, dtype=bool).reshape(nz - 1, ncols)
+
+    tt, zz = np.meshgrid(thetas, z_edges)
+    ring = np.column_stack((np.cos(tt).ravel(), np.sin(tt).ravel()))
+    vertices = np.concatenate((np.column_stack((ring * r_inner, zz.ravel())), np.column_stack((ring * r_outer, zz.ravel()))))
+    inner = np.arange(nz * nt).reshape(nz, nt)
+    outer = inner + nz * nt
+    if r_inner == 0:
+        inner[:] = inner[:, :1]
+
+    cols = np.arange(ncols)
+    cols_next = (cols + 1) % nt
+    quads = []
+
+    # outer and inner wall
+    k, j = np.nonzero(occupied)
+    quads.append(np.column_stack((outer[k, cols[j]], outer[k, cols_next[j]], outer[k + 1, cols_next[j]], outer[k + 1, cols[j]])))
+    if r_inner > 0 and not outer_only:
+        quads.append(np.column_stack((inner[k, cols[j]], inner[k + 1, cols[j]], inner[k + 1, cols_next[j]], inner[k, cols_next[j]])))
+
+    if not outer_only:
+        # horizontal faces where the occupancy changes between two z bands
+        padded = np.pad(occupied, ((1, 1), (0, 0)))
+        below, above = padded[:-1], padded[1:]
+        k, j = np.nonzero(below & ~above)
+        quads.append(np.column_stack((outer[k, cols[j]], outer[k, cols_next[j]], inner[k, cols_next[j]], inner[k, cols[j]])))
+        k, j = np.nonzero(~below & above)
+        quads.append(np.column_stack((outer[k, cols[j]], inner[k, cols[j]], inner[k, cols_next[j]], outer[k, cols_next[j]])))
+
+        # radial faces where the occupancy changes between two angular columns
+        if closed:
+            left, right = np.roll(occupied, 1, axis=1), occupied
+        else:
+            padded = np.pad(occupied, ((0, 0), (1, 1)))
+            left, right = padded[:, :-1], padded[:, 1:]
+        k, j = np.nonzero(left & ~right)
+        quads.append(np.column_stack((outer[k, j], inner[k, j], inner[k + 1, j], outer[k + 1, j])))
+        k, j = np.nonzero(~left & right)
+        quads.append(np.column_stack((outer[k, j], outer[k + 1, j], inner[k + 1, j], inner[k, j])))
+
+    return _compact(vertices, _triangulate(np.concatenate(quads)))
+
+
+def sector_columns(sectors, nr_vertices):
+    # segments and gaps of a level on the grid of _circle(nr_vertices): first column of every sector and the end of the last one
+    # sectors are consecutive (start, end) angles in degrees, their borders are snapped to the nearest angle of the grid
+    # and every sector keeps at least one column
+    nr_sectors = len(sectors)
+    if nr_sectors > nr_vertices:
+        raise ValueError(f'{nr_sectors} segments and gaps need nr_vertices >= {nr_sectors}')
+    borders = np.round(np.array([start for start, _ in sectors]) / (360 / nr_vertices)).astype(np.int64)
+    borders = np.append(borders, borders[0] + nr_vertices)
+    k = np.arange(nr_sectors + 1)
+    offsets = np.minimum(np.maximum.accumulate(borders - k), borders[0] + nr_vertices - nr_sectors)
+    return offsets + k
+
+
+def sector_solids(r_inner, r_outer, length, sectors, nr_vertices, outer_only=False):
+    # closed solids (z from 0 to length) of all segments and gaps of a level, computed together on one grid in which every
+    # column belongs to one sector, returns (vertices, faces) per sector
+    borders = sector_columns(sectors, nr_vertices)
+    n, m = nr_vertices, nr_vertices + 1  # the last angle is the first one again, so the last sector does not wrap around
+    thetas = np.arange(borders[0], borders[-1] + 1) * (2 * math.pi / n)
+    ring = np.column_stack((np.cos(thetas), np.sin(thetas)))
+    bottom, top = np.zeros((m, 1)), np.full((m, 1), length)
+    vertices = np.concatenate((np.hstack((ring * r_inner, bottom)), np.hstack((ring * r_inner, top)),
+                               np.hstack((ring * r_outer, bottom)), np.hstack((ring * r_outer, top))))
+    inner_bottom, inner_top, outer_bottom, outer_top = np.arange(4 * m).reshape(4, m)
+    if r_inner == 0:
+        inner_bottom[:], inner_top[:] = inner_bottom[0], inner_top[0]
+
+    c = np.arange(n)
+    owner = np.repeat(np.arange(len(sectors)), np.diff(borders))
+    start, end = borders[:-1] - borders[0], borders[1:] - borders[0]
+    quads = [np.column_stack((outer_bottom[c], outer_bottom[c + 1], outer_top[c + 1], outer_top[c]))]
+    owners = [owner]
+    if not outer_only:
+        quads += [np.column_stack((outer_top[c], outer_top[c + 1], inner_top[c + 1], inner_top[c])),
+                  np.column_stack((outer_bottom[c], inner_bottom[c], inner_bottom[c + 1], outer_bottom[c + 1])),
+                  np.column_stack((outer_bottom[start], outer_top[start], inner_top[start], inner_bottom[start])),
+                  np.column_stack((outer_bottom[end], inner_bottom[end], inner_top[end], outer_top[end]))]
+        owners += [owner, owner, np.arange(len(sectors)), np.arange(len(sectors))]
+        if r_inner > 0:
+            quads.append(np.column_stack((inner_bottom[c], inner_top[c], inner_top[c + 1], inner_bottom[c + 1])))
+            owners.append(owner)
+
+    quads, owners = np.concatenate(quads), np.concatenate(owners)
+    tris = np.concatenate((quads[:, [0, 1, 2]], quads[:, [0, 2, 3]]))
+    owners = np.concatenate((owners, owners))
+    valid = (tris[:, 0] != tris[:, 1]) & (tris[:, 1] != tris[:, 2]) & (tris[:, 0] != tris[:, 2])
+    tris, owners = tris[valid], owners[valid]
+    return [_compact(vertices, tris[owners == i]) for i in range(len(sectors))]
+
+
+def component_angles(component, nr_vertices):
+    # angular range (degrees) of a component as it is built, segments and gaps are snapped to the grid (see sector_columns)
+    if component.get('sectors') is None:
+        return component['angles']
+    borders = sector_columns(component['sectors'], nr_vertices) * (360 / nr_vertices)
+    return float(borders[component['sector']]), float(borders[component['sector'] + 1])
+
+
+def components_from_layout(layout):
+    # components as dicts (name, kind, material, z range, angles and marker window) from a compiled layout table
+    # segments and gaps also know all sectors of their level ((start, end) angles) and their index among them
+    kinds = dict(enumerate(electrode_layout.KINDS))
+    windows = layout[layout['kind'] == electrode_layout.WINDOW]
+    is_sector = np.isin(layout['kind'], (electrode_layout.SEGMENT, electrode_layout.GAP))
+    levels = {}
+    for i in np.flatnonzero(is_sector):
+        levels.setdefault((int(layout[i]['electrode']), int(layout[i]['level'])), []).append(i)
+
+    components = []
+    for i, row in enumerate(layout):
+        kind = kinds[int(row['kind'])]
+        material = CONTACT if row['contact_id'] >= 0 else INSULATION
+        angles = None
+        if row['angle_extent'] < 360:
+            angles = (float(row['angle_start']), float(row['angle_start'] + row['angle_extent']))
+        window = None
+        if kind == 'marker':
+            w = windows[windows['electrode'] == row['electrode']][0]
+            window = (float(w['z_start']), float(w['z_end']), (float(w['angle_start']), float(w['angle_start'] + w['angle_extent'])))
+        sectors, sector = None, None
+        if is_sector[i]:
+            level = levels[(int(row['electrode']), int(row['level']))]
+            sectors = tuple((float(layout[j]['angle_start']), float(layout[j]['angle_start'] + layout[j]['angle_extent'])) for j in level)
+            sector = level.index(i)
+        components.append({'name': ('con' + str(row['contact_id'])) if material == CONTACT else ('ins' + str(row['insulation_id'])),
+                           'kind': kind, 'material': material, 'z0': float(row['z_start']), 'z1': float(row['z_end']),
+                           'angles': angles, 'window': window, 'sectors': sectors, 'sector': sector})
+    return components
+
+
+def electrode_components(elspec, name=''):
+    # position of every component along the lead, from the compiled (and validated) layout of the spec
+    return components_from_layout(electrode_layout.compile_layout(elspec, name))
+
+
+def _marker_grid(component, nr_vertices):
+    # grid of the marker ring with rows and columns at the borders of the window, and the cells that form the window
+    z_start, z_end, (start_angle, end_angle) = component['window']
+    thetas = _circle(nr_vertices)
+    window = np.radians([start_angle, end_angle])
+    thetas = np.unique(np.round(np.concatenate((thetas, np.mod(window, 2 * math.pi))), 12))
+    z_edges = [component['z0'], z_start, z_end, component['z1']]
+    mid = np.mod(thetas + (np.roll(thetas, -1) - thetas) % (2 * math.pi) / 2 - window[0], 2 * math.pi)
+    in_window = mid < (window[1] - window[0])
+    cells = np.zeros((3, len(thetas)), dtype=bool)
+    cells[1] = in_window
+    return z_edges, thetas, cells
+
+
+def chordal_error(radius, nr_vertices):
+    # maximum distance between a circle and the polygon with nr_vertices that approximates it
+    return radius * (1 - math.cos(math.pi / nr_vertices))
+
+
+def tip_rings(radius, nr_vertices, chordal_tolerance=None):
+    # number of rings of the tip half sphere, so that no ring segment deviates more than chordal_tolerance (mm) from the sphere
+    # without tolerance, the same number of rings as the UV sphere of create_tip is used
+    if chordal_tolerance is None:
+        return max(1, nr_vertices // 4)
+    step = 2 * math.acos(max(-1.0, 1 - chordal_tolerance / radius))
+    return max(1, math.ceil(math.pi / 2 / step - 1e-9))
+
+
+def tip_mesh(radius, tip_length, nr_vertices, outer_only=False, radius_inner=0, rings=None):
+    # half sphere at the bottom of the lead with a cylinder on top (same as create_tip)
+    # with radius_inner > 0, the inner bore is cut into the tip down to bore_start (same as the boolean with ins_inner)
+    if rings is None:
+        rings = tip_rings(radius, nr_vertices)
+    phi = np.linspace(0, math.pi / 2, rings + 1)
+    rho = list(radius * np.sin(phi)) + [radius]
+    z = list(radius - radius * np.cos(phi)) + [tip_length]
+    if not outer_only:
+        if radius_inner > 0:
+            rho = rho + [radius_inner, radius_inner]
+            z = z + [tip_length, bore_start * radius]
+        rho.append(0)
+        z.append(z[-1])
+    return _revolve(rho, z, _circle(nr_vertices))
+
+
+# stage names (see instrumentation.py) of the components, named after the functions in create_electrode_model.py that build them
+stage_names = {'tip_contact': 'create_tip', 'tip_insulation': 'create_tip', 'contact': 'create_contact (ring)',
+               'segment': 'create_contact (segmented)', 'gap': 'create_contact (segmented)', 'insulation': 'create_insulation',
+               'marker': 'create_marker', 'window': 'create_marker', 'inner': 'remove_inner_apply_materials'}
+
+
+@stage(lambda component, *args: stage_names[component['kind']])
+def _build_component_mesh(component, radius, nr_vertices, outer_only, radius_inner, rings):
+    if component['kind'].startswith('tip'):
+        vertices, faces = tip_mesh(radius, component['z1'] - component['z0'], nr_vertices, outer_only, radius_inner, rings)
+        return MeshData(vertices, faces, np.full(len(faces), component['material']))
+
+    if component.get('sectors') is not None:
+        # all sectors of the level are built at once, see _level_solids
+        solids = _level_solids(component['sectors'], radius, nr_vertices, outer_only, radius_inner, round(component['z1'] - component['z0'], 9))
+        vertices, faces = solids[component['sector']]
+        vertices = vertices + [0, 0, component['z0']]
+    elif component['window'] is not None:
+        z_edges, thetas, window = _marker_grid(component, nr_vertices)
+        vertices, faces = _cell_solid(radius_inner, radius, z_edges, thetas, ~window, closed=True, outer_only=outer_only)
+    elif component['angles'] is not None:
+        thetas = _arc(component['angles'][0], component['angles'][1], nr_vertices)
+        vertices, faces = _cell_solid(radius_inner, radius, [component['z0'], component['z1']], thetas, [[True] * (len(thetas) - 1)], closed=False, outer_only=outer_only)
+    else:
+        thetas = _circle(nr_vertices)
+        vertices, faces = _cell_solid(radius_inner, radius, [component['z0'], component['z1']], thetas, [[True] * nr_vertices], closed=True, outer_only=outer_only)
+    return MeshData(vertices, faces, np.full(len(faces), component['material']))
+
+
+def component_key(component):
+    # geometric parameters of a component without its position along the lead, components with equal keys have the same mesh
+    z0 = component['z0']
+    angles = tuple(component['angles']) if component['angles'] is not None else None
+    window = component['window']
+    if window is not None:
+        window = (round(window[0] - z0, 9), round(window[1] - z0, 9), tuple(window[2]))
+    sectors = component.get('sectors')
+    if sectors is not None:
+        sectors = tuple(tuple(sector) for sector in sectors)
+    return component['kind'], component['material'], round(component['z1'] - z0, 9), angles, window, sectors, component.get('sector')
+
+
+@functools.lru_cache(maxsize=64)
+def _level_solids(sectors, radius, nr_vertices, outer_only, radius_inner, length):
+    solids = sector_solids(radius_inner, radius, length, sectors, nr_vertices, outer_only)
+    for vertices, faces in solids:
+        vertices.flags.writeable = False
+        faces.flags.writeable = False
+    return solids
+
+
+@functools.lru_cache(maxsize=1024)
+def _local_component_mesh(key, radius, nr_vertices, outer_only, radius_inner, rings):
+    kind, material, length, angles, window, sectors, sector = key
+    component = {'kind': kind, 'material': material, 'z0': 0, 'z1': length, 'angles': angles, 'window': window,
+                 'sectors': sectors, 'sector': sector}
+    mesh = _build_component_mesh(component, radius, nr_vertices, outer_only, radius_inner, rings)
+    for array in (mesh.vertices, mesh.faces, mesh.material_index, mesh.component_index):
+        array.flags.writeable = False  # shared between all components with the same key
+    return mesh
+
+
+def clear_cache():
+    # forget all memoized component meshes (e.g. to measure cold builds)
+    _local_component_mesh.cache_clear()
+    _level_solids.cache_clear()
+
+
+def local_component_mesh(component, radius, nr_vertices, outer_only=False, radius_inner=0, rings=None):
+    # mesh of a component starting at z = 0, generated once per distinct set of geometric parameters (see component_key)
+    if rings is None:
+        rings = tip_rings(radius, nr_vertices)
+    return _local_component_mesh(component_key(component), radius, nr_vertices, outer_only, radius_inner, rings)
+
+
+def component_mesh(component, radius, nr_vertices, outer_only=False, radius_inner=0, rings=None):
+    # closed solid of a single component (or only its outer wall), radius_inner > 0 gives an annular solid around the bore
+    with annotate(component=component['name']):
+        return local_component_mesh(component, radius, nr_vertices, outer_only, radius_inner, rings).translated(component['z0'])
+
+
+def build_electrode(elspec, nr_vertices=72, name='', hollow=True, chordal_tolerance=None):
+    # returns the final outer surface of the lead and a list of (component, closed component mesh)
+    # the faces of the final surface are sorted by component (see MeshData.face_offsets), component i is parts[i]
+    # with hollow, the components are annular solids around the inner bore and the bore itself is added as ins_inner,
+    # which gives the same result as the boolean modifiers of remove_inner_apply_materials without running them
+    # chordal_tolerance (mm) sets the number of rings of the tip, see tip_rings
+    radius = elspec['lead_diameter'] / 2
+    radius_inner = radius / 2 if hollow else 0
+    rings = tip_rings(radius, nr_vertices, chordal_tolerance)
+    components = electrode_components(elspec, name)
+
+    parts = [(component, component_mesh(component, radius, nr_vertices, radius_inner=radius_inner, rings=rings)) for component in components]
+
+    if hollow:
+        inner = {'name': 'ins_inner', 'kind': 'inner', 'material': INSULATION, 'z0': bore_start * radius, 'z1': elspec['lead_length'], 'angles': None, 'window': None,
+                 'sectors': None, 'sector': None}
+        parts.append((inner, component_mesh(inner, radius_inner, nr_vertices)))
+
+    parts = [(component, MeshData(part.vertices, part.faces, part.material_index, np.full(len(part.faces), i))) for i, (component, part) in enumerate(parts)]
+
+    return final_surface(components, radius, nr_vertices, rings), parts
+
+
+@stage('create_final')
+def final_surface(components, radius, nr_vertices, rings):
+    # outer surface of the whole lead as a single surface of revolution: the half sphere of the tip, one ring at every border
+    # between components and the top of the lead share their vertices, so the surface is watertight without merging vertices
+    # the rings consist of the circle of nr_vertices and the borders of all segments, gaps and marker windows
+    thetas = [_circle(nr_vertices)]
+    z_edges = []
+    for component in components:
+        z_edges += [component['z0'], component['z1']]
+        if component['angles'] is not None and component.get('sectors') is None:  # sectors are on the circle already
+            thetas.append(_arc(component['angles'][0], component['angles'][1], nr_vertices))
+        if component['window'] is not None:
+            z_edges += component['window'][:2]
+            thetas.append(np.radians(component['window'][2]))
+    thetas = np.round(np.mod(np.concatenate(thetas), 2 * math.pi), 12)
+    thetas = np.unique(np.where(thetas < round(2 * math.pi, 12), thetas, 0))
+    z_edges = np.unique(np.round(z_edges, 12))
+
+    phi = np.linspace(0, math.pi / 2, rings + 1)
+    z_edges = z_edges[z_edges > radius]
+    rho = np.concatenate((radius * np.sin(phi), np.full(len(z_edges), radius), [0]))
+    z = np.concatenate((radius - radius * np.cos(phi), z_edges, z_edges[-1:]))
+    vertices, faces = _revolve(rho, z, thetas)
+
+    # every face belongs to the component that contains its centroid, the top of the lead to the last component
+    centroids = vertices[faces].mean(axis=1)
+    centroid_z = centroids[:, 2]
+    centroid_theta = np.mod(np.arctan2(centroids[:, 1], centroids[:, 0]), 2 * math.pi)
+
+    def in_arc(start_angle, end_angle):
+        return np.mod(centroid_theta - math.radians(start_angle), 2 * math.pi) < math.radians(end_angle - start_angle)
+
+    component_index = np.full(len(faces), max(range(len(components)), key=lambda i: components[i]['z1']))
+    for i, component in enumerate(components):
+        inside = (centroid_z >= component['z0']) & (centroid_z < component['z1'])
+        if component['angles'] is not None:
+            inside &= in_arc(*component_angles(component, nr_vertices))
+        if component['window'] is not None:
+            z_start, z_end, angles = component['window']
+            inside &= ~((centroid_z >= z_start) & (centroid_z < z_end) & in_arc(*angles))
+        component_index[inside] = i
+
+    material_index = np.array([component['material'] for component in components])[component_index]
+    return MeshData(vertices, faces, material_index, component_index).sorted_by_component()
+
+
+def face_normals(mesh):
+    v = mesh.vertices[mesh.faces]
+    normals = np.cross(v[:, 1] - v[:, 0], v[:, 2] - v[:, 0])
+    return normals / np.maximum(np.linalg.norm(normals, axis=1, keepdims=True), 1e-300)
+
+
+def loop_normals(mesh, radius, tolerance=1e-6):
+    # exact normal of the surface at every face corner (faces x 3 x 3), so that a coarse mesh shades like a fine one:
+    # spherical on the half sphere of the tip (center (0, 0, radius)), radial on cylinders (also the inner bore) and the
+    # face normal on flat faces (tops and bottoms, sides of segments, gaps and marker windows)
+    v = mesh.vertices[mesh.faces]
+    normal = face_normals(mesh)
+    normals = np.repeat(normal[:, None], 3, axis=1)
+
+    rho = np.linalg.norm(v[..., :2], axis=-1)
+    radial = np.zeros_like(v)
+    radial[..., :2] = v[..., :2] / np.maximum(rho, 1e-300)[..., None]
+    facing = np.einsum('fij,fj->fi', radial, normal)
+    cylinder = (np.abs(normal[:, 2]) < 0.5) & (np.abs(facing) > 0.5).all(axis=1) & (rho > tolerance).all(axis=1)
+    normals[cylinder] = radial[cylinder] * np.sign(facing[cylinder])[..., None]
+
+    offset = v - [0, 0, radius]
+    distance = np.linalg.norm(offset, axis=-1)
+    sphere = (np.abs(distance - radius) < tolerance * max(radius, 1)).all(axis=1) & (v[..., 2] <= radius + tolerance).all(axis=1)
+    sphere &= np.einsum('fij,fj->fi', offset, normal).min(axis=1) > 0
+    normals[sphere] = offset[sphere] / distance[sphere][..., None]
+    return normals
+
+
+def sharp_edges(mesh, normals, tolerance=1e-6):
+    # (vertex, vertex) pairs (lower index first) of the edges where the shading is not continuous: between components
+    # (contact/insulation and segment borders), where the loop normals of the two faces differ and at open borders
+    faces = mesh.faces.astype(np.int64)
+    edges = np.stack((faces, np.roll(faces, -1, axis=1)), axis=-1).reshape(-1, 2)
+    at_first, at_second = normals.reshape(-1, 3), np.roll(normals, -1, axis=1).reshape(-1, 3)
+    flipped = edges[:, 0] > edges[:, 1]
+    edges = np.sort(edges, axis=1)
+    low = np.where(flipped[:, None], at_second, at_first)  # normals at both vertices of the edge, lower index first
+    high = np.where(flipped[:, None], at_first, at_second)
+    component = np.repeat(mesh.component_index, 3)
+
+    keys = edges[:, 0] * len(mesh.vertices) + edges[:, 1]
+    order = np.argsort(keys, kind='stable')
+    keys = keys[order]
+    starts = np.flatnonzero(np.diff(keys, prepend=-1))
+    counts = np.diff(np.append(starts, len(keys)))
+    sharp = counts != 2
+
+    # manifold edges: compare the two faces of the edge
+    pairs = starts[~sharp]
+    a, b = order[pairs], order[pairs + 1]
+    smooth = ((low[a] * low[b]).sum(axis=1) > 1 - tolerance) & ((high[a] * high[b]).sum(axis=1) > 1 - tolerance)
+    sharp[~sharp] = ~smooth | (component[a] != component[b])
+    return edges[order[starts[sharp]]]
+
+
+# offsets of 13 of the 26 neighbouring cells, one of each pair of opposite neighbours
+_neighbours = np.array([(dx, dy, dz) for dx in (-1, 0, 1) for dy in (-1, 0, 1) for dz in (-1, 0, 1) if (dx, dy, dz) > (0, 0, 0)])
+
+
+def _dense_cells(cells):
+    # cell coordinates renumbered per axis without changing which cells are neighbours: consecutive coordinates stay
+    # consecutive and larger gaps shrink to 2, so the cells fit into a much smaller grid (starting at 1)
+    dense = np.empty_like(cells)
+    for i in range(3):
+        values, inverse = np.unique(cells[:, i], return_inverse=True)
+        dense[:, i] = np.concatenate(([1], 1 + np.cumsum(np.minimum(np.diff(values), 2))))[inverse.reshape(-1)]
+    return dense
+
+
+def merge_vertices(vertices, distance):
+    # vertices are rounded to cells of size distance and all vertices of a cell are merged into its first vertex, cells
+    # whose first vertices are closer than distance are merged as well (also across diagonals), so vertices on both sides
+    # of a cell border are merged like with remove_doubles
+    # sort based (O(n log n)): one integer key per cell, the neighbouring cells are looked up in the sorted keys
+    # returns the index of the merged vertex for every vertex and the merged vertices
+    vertices = np.asarray(vertices, dtype=np.float64).reshape(-1, 3)
+    if not len(vertices):
+        return np.zeros(0, dtype=np.int64), vertices
+    cells = _dense_cells(np.round(vertices / distance).astype(np.int64))
+    size = cells.max(axis=0) + 2  # room for the neighbours of the last cell
+
+    # key = column * size[2] + z, columns ((x, y) pairs) are numbered by their rank if the grid is too large for int64
+    columns = cells[:, 0] * size[1] + cells[:, 1]
+    occupied_columns = None
+    if math.prod(int(n) for n in size) >= 2 ** 63:
+        occupied_columns = np.unique(columns)
+
+    def find(values, sorted_values):
+        # index of every value in sorted_values, -1 if it is missing
+        i = np.minimum(np.searchsorted(sorted_values, values), len(sorted_values) - 1)
+        return np.where(sorted_values[i] == values, i, -1)
+
+    def key(columns, z):
+        if occupied_columns is not None:
+            columns = find(columns, occupied_columns)
+        return np.where(columns >= 0, columns * size[2] + z, -1)
+
+    keys, first, inverse = np.unique(key(columns, cells[:, 2]), return_index=True, return_inverse=True)
+    inverse = inverse.reshape(-1)
+
+    # pairs of neighbouring cells whose first vertices are closer than distance
+    a, b = [], []
+    for dx, dy, dz in _neighbours:
+        neighbour = key(columns[first] + dx * size[1] + dy, cells[first, 2] + dz)
+        j = np.where(neighbour >= 0, find(neighbour, keys), -1)
+        close = np.flatnonzero(j >= 0)
+        close = close[np.linalg.norm(vertices[first[close]] - vertices[first[j[close]]], axis=1) <= distance]
+        a.append(close)
+        b.append(j[close])
+    a, b = np.concatenate(a), np.concatenate(b)
+
+    # connected cells get the lowest cell number of their group
+    labels = np.arange(len(keys))
+    while len(a):
+        lowest = np.minimum(labels[a], labels[b])
+        previous = labels.copy()
+        np.minimum.at(labels, a, lowest)
+        np.minimum.at(labels, b, lowest)
+        labels = labels[labels]
+        if np.array_equal(labels, previous):
+            break
+
+    groups, index = np.unique(labels, return_inverse=True)
+    return index.reshape(-1)[inverse], vertices[first[groups]]
+
+
+def build_lod_chain(elspec, lod_levels=LOD_LEVELS, name='', hollow=True, chordal_tolerance=None):
+    # final surfaces and components for every level of detail, as {nr_vertices: (final, parts)}
+    # without chordal_tolerance, the tip of each level is as precise as the circumference of its cylinders
+    radius = elspec['lead_diameter'] / 2
+    chain = {}
+    for nr_vertices in lod_levels:
+        tolerance = chordal_error(radius, nr_vertices) if chordal_tolerance is None else chordal_tolerance
+        chain[nr_vertices] = build_electrode(elspec, nr_vertices, name, hollow, tolerance)
+    return chain
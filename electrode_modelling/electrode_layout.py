@@ -0,0 +1,215 @@
+import numbers
+import warnings
+
+import numpy as np
+
+from instrumentation import stage
+
+# kinds of components in the layout table
+KINDS = ('tip_contact', 'tip_insulation', 'contact', 'insulation', 'segment', 'gap', 'marker', 'window')
+TIP_CONTACT, TIP_INSULATION, CONTACT, INSULATION, SEGMENT, GAP, MARKER, WINDOW = range(len(KINDS))
+
+# one row per component: position along the lead (mm), angular range (degrees, 360 for full rings), contact or insulation number
+# (-1 if not applicable), level of the spec it belongs to (-1 for the marker) and index of the electrode in the catalog
+LAYOUT_DTYPE = np.dtype([('kind', 'u1'), ('z_start', 'f8'), ('z_end', 'f8'), ('angle_start', 'f8'), ('angle_extent', 'f8'),
+                         ('contact_id', 'i4'), ('insulation_id', 'i4'), ('level', 'i2'), ('electrode', 'i4')])
+
+marker_offset = 0.2  # distance between marker window and the marker borders (same as create_marker)
+segment_startangle = 40  # segmented levels start with a contact at this angle, unless their spec has a "start_angle"
+
+
+class SpecError(ValueError):
+    pass
+
+
+def _number(value, minimum=0, allow_zero=False):
+    return isinstance(value, numbers.Real) and not isinstance(value, bool) and (value >= minimum if allow_zero else value > minimum)
+
+
+def validate_spec(elspec, name=''):
+    # schema check of a single electrode spec, raises SpecError before any geometry is built
+    def fail(message):
+        raise SpecError(f'{name or "electrode"}: {message}')
+
+    if not isinstance(elspec, dict):
+        fail('specification has to be an object')
+    for key in ('lead_diameter', 'lead_length', 'contact_spacing', 'num_level', 'tipiscontact', 'contact_specification'):
+        if key not in elspec:
+            fail(f'"{key}" is missing')
+    if not _number(elspec['lead_diameter']) or not _number(elspec['lead_length']):
+        fail('"lead_diameter" and "lead_length" have to be positive numbers')
+    if elspec['tipiscontact'] not in (0, 1):
+        fail('"tipiscontact" has to be 0 or 1')
+
+    nr_elements = elspec['num_level']
+    if not isinstance(nr_elements, int) or isinstance(nr_elements, bool) or nr_elements < 1:
+        fail('"num_level" has to be a positive integer')
+    if not elspec['tipiscontact'] and nr_elements < 2:
+        fail('"num_level" has to be at least 2 if the tip is not a contact')
+
+    spacing = elspec['contact_spacing']
+    if not isinstance(spacing, list) or not spacing or not all(_number(s) for s in spacing):
+        fail('"contact_spacing" has to be a non-empty list of positive numbers')
+    needed = nr_elements - 1 if elspec['tipiscontact'] else nr_elements - 2
+    if len(spacing) > 1 and len(spacing) < needed:
+        fail(f'"contact_spacing" needs 1 or at least {needed} entries')
+
+    levels = elspec['contact_specification']
+    if not isinstance(levels, dict):
+        fail('"contact_specification" has to be an object')
+    for el_nr in range(nr_elements):
+        level = levels.get(str(el_nr))
+        if not isinstance(level, dict):
+            fail(f'level "{el_nr}" is missing in "contact_specification"')
+        if not _number(level.get('length')):
+            fail(f'level {el_nr}: "length" has to be a positive number')
+        if level.get('segmented'):
+            if el_nr == 0:
+                fail('the tip cannot be segmented')
+            num_segments, size_segments = level.get('num_segments'), level.get('size_segments')
+            if not isinstance(num_segments, int) or isinstance(num_segments, bool) or num_segments < 1:
+                fail(f'level {el_nr}: "num_segments" has to be a positive integer')
+            if not _number(size_segments) or num_segments * size_segments >= 360:
+                fail(f'level {el_nr}: "size_segments" has to be positive and the segments have to cover less than 360 degrees '
+                     f'(they need insulation between them)')
+            if 'start_angle' in level and not _number(level['start_angle'], allow_zero=True):
+                fail(f'level {el_nr}: "start_angle" has to be a number >= 0')
+
+    if levels['0']['length'] <= elspec['lead_diameter'] / 2:
+        fail('the tip has to be longer than the lead radius')
+
+    marker_keys = ('marker_pos', 'marker_length', 'marker_startangle', 'marker_size')
+    if 'marker_pos' in elspec:
+        if not all(_number(elspec.get(key), allow_zero=True) for key in marker_keys):
+            fail('a marker needs numeric "' + '", "'.join(marker_keys) + '"')
+        if elspec['marker_length'] <= 2 * marker_offset or not 0 < elspec['marker_size'] < 360:
+            fail(f'the marker has to be longer than {2 * marker_offset} mm and its window smaller than 360 degrees')
+        if elspec['marker_pos'] + elspec['marker_length'] > elspec['lead_length']:
+            fail('the marker ends after the end of the lead')
+        # the levels and the spacings between them are stacked from the tip, the marker comes after them
+        levels_end = sum(levels[str(el_nr)]['length'] for el_nr in range(nr_elements))
+        levels_end += spacing[0] * needed if len(spacing) == 1 else sum(spacing[:needed])
+        if elspec['marker_pos'] <= levels_end:
+            fail(f'"marker_pos" ({elspec["marker_pos"]:g} mm) has to be after the end of the last level ({levels_end:g} mm)')
+
+
+def _rows(elspec, name):
+    # components of one electrode in construction order (same order and numbering as create_electrode_model.py)
+    # each row: kind, advance (mm the stacked z moves after it), length (nan: ends at fixed_end), fixed_start (nan: stacked),
+    # fixed_end, angle_start, angle_extent, contact_id, insulation_id, level
+    levels = elspec['contact_specification']
+    nr_elements = elspec['num_level']
+    contact_spacing = elspec['contact_spacing']
+    total_length = elspec['lead_length']
+    tip_is_contact = elspec['tipiscontact']
+    nan = float('nan')
+
+    def spacing(el_nr):
+        if len(contact_spacing) == 1:
+            return contact_spacing[0]
+        return contact_spacing[el_nr] if tip_is_contact else contact_spacing[el_nr - 1]
+
+    rows = []
+    contact_nr = 0
+    insulation_nr = 0
+
+    for el_nr in range(nr_elements):
+        length = levels[str(el_nr)]['length']
+        if el_nr == 0:
+            if tip_is_contact:
+                rows.append((TIP_CONTACT, length, length, nan, nan, 0, 360, 0, -1, 0))
+                if nr_elements == 1:
+                    rows.append((INSULATION, 0, nan, nan, total_length, 0, 360, -1, insulation_nr, 0))
+                else:
+                    rows.append((INSULATION, spacing(0), spacing(0), nan, nan, 0, 360, -1, 0, 0))
+                    contact_nr = contact_nr + 1
+            else:
+                rows.append((TIP_INSULATION, length, length, nan, nan, 0, 360, -1, 0, 0))
+
+            if nr_elements > 1:
+                insulation_nr = insulation_nr + 1
+            continue
+
+        level = levels[str(el_nr)]
+        if not level['segmented']:
+            rows.append((CONTACT, length, length, nan, nan, 0, 360, contact_nr, -1, el_nr))
+            contact_nr = contact_nr + 1
+        else:
+            # segments and the insulations between them alternate around the lead, only the last one advances z
+            num_segments = level['num_segments']
+            size_segments = level['size_segments']
+            size_insulations = (360 - num_segments * size_segments) / num_segments
+            rot_angle = level.get('start_angle', segment_startangle)
+            for nr_segm in range(num_segments):
+                rows.append((SEGMENT, 0, length, nan, nan, rot_angle, size_segments, contact_nr + nr_segm, -1, el_nr))
+                rot_angle = rot_angle + size_segments
+                advance = length if nr_segm == num_segments - 1 else 0
+                rows.append((GAP, advance, length, nan, nan, rot_angle, size_insulations, -1, insulation_nr + nr_segm, el_nr))
+                rot_angle = rot_angle + size_insulations
+            contact_nr = contact_nr + num_segments
+            insulation_nr = insulation_nr + num_segments
+
+        if el_nr != nr_elements - 1:
+            rows.append((INSULATION, spacing(el_nr), spacing(el_nr), nan, nan, 0, 360, -1, insulation_nr, el_nr))
+            insulation_nr = insulation_nr + 1
+        elif 'marker_pos' not in elspec:
+            rows.append((INSULATION, 0, nan, nan, total_length, 0, 360, -1, insulation_nr, el_nr))
+        else:
+            rows.append((INSULATION, 0, nan, nan, elspec['marker_pos'], 0, 360, -1, insulation_nr, el_nr))
+            rows.append((INSULATION, 0, nan, elspec['marker_pos'] + elspec['marker_length'], total_length, 0, 360, -1, insulation_nr + 2, el_nr))
+
+    if 'marker_pos' in elspec:
+        if 'B33' in name:  # this is for sensight
+            warnings.warn(f'{name}: the marker of Sensight electrodes is not implemented yet, the lead is built without it')
+        else:
+            z0 = elspec['marker_pos']
+            z1 = z0 + elspec['marker_length']
+            rows.append((MARKER, 0, nan, z0, z1, 0, 360, contact_nr, -1, -1))
+            rows.append((WINDOW, 0, nan, z0 + marker_offset, z1 - marker_offset, elspec['marker_startangle'], elspec['marker_size'], -1, insulation_nr + 1, -1))
+
+    return rows
+
+
+def compile_catalog(elspecs, validate=True):
+    # layout table of all electrodes of a catalog {name: spec}; the row of each component is generated per spec,
+    # the z positions of all electrodes are computed together in one vectorized pass
+    names = list(elspecs)
+    rows = []
+    electrode = []
+    for i, name in enumerate(names):
+        if validate:
+            validate_spec(elspecs[name], name)
+        electrode_rows = _rows(elspecs[name], name)
+        rows.extend(electrode_rows)
+        electrode.extend([i] * len(electrode_rows))
+
+    columns = np.array(rows, dtype=np.float64).reshape(-1, 10)
+    electrode = np.asarray(electrode, dtype=np.int64)
+    advance, length, fixed_start, fixed_end = columns[:, 1], columns[:, 2], columns[:, 3], columns[:, 4]
+
+    # stacked components start where the previous ones ended (exclusive running sum of advance, restarted for every electrode)
+    total = np.cumsum(advance) - advance
+    first_row = np.searchsorted(electrode, electrode)
+    stacked_start = total - total[first_row] if len(total) else total
+
+    layout = np.empty(len(columns), dtype=LAYOUT_DTYPE)
+    layout['kind'] = columns[:, 0]
+    layout['z_start'] = np.where(np.isnan(fixed_start), stacked_start, fixed_start)
+    layout['z_end'] = np.where(np.isnan(length), fixed_end, layout['z_start'] + np.nan_to_num(length))
+    layout['angle_start'] = columns[:, 5]
+    layout['angle_extent'] = columns[:, 6]
+    layout['contact_id'] = columns[:, 7]
+    layout['insulation_id'] = columns[:, 8]
+    layout['level'] = columns[:, 9]
+    layout['electrode'] = electrode
+
+    if validate:
+        for i in np.unique(electrode[layout['z_end'] <= layout['z_start']]):
+            raise SpecError(f'{names[i]}: components do not fit into "lead_length"')
+    return layout
+
+
+@stage('layout')
+def compile_layout(elspec, name=''):
+    # layout table of a single electrode, see LAYOUT_DTYPE
+    return compile_catalog({name: elspec})
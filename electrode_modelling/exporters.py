@@ -0,0 +1,127 @@
+import json
+import os
+
+import numpy as np
+
+import electrode_geometry
+
+# the exporters write whole numpy buffers at once (header first, then the packed arrays), there are no per-vertex loops
+# quantize=None writes float32 positions, 'int16' writes 16 bit integers with a scale and offset (PLY and glTF only)
+
+
+def _write_array(f, array):
+    # write the raw bytes of an array without copying it into a bytes object
+    f.write(memoryview(np.ascontiguousarray(array).reshape(-1).view(np.uint8)))
+
+
+def quantize_positions(vertices, quantize):
+    # returns (positions, scale, offset) with vertices = positions * scale + offset
+    vertices = np.asarray(vertices, dtype=np.float64)
+    if quantize is None:
+        return vertices.astype('<f4'), 1.0, np.zeros(3)
+    if quantize == 'int16':
+        offset = (vertices.min(axis=0) + vertices.max(axis=0)) / 2 if len(vertices) else np.zeros(3)
+        half_extent = np.abs(vertices - offset).max() if len(vertices) else 0
+        scale = half_extent / 32767 if half_extent > 0 else 1.0
+        return np.round((vertices - offset) / scale).astype('<i2'), scale, offset
+    raise ValueError(f'unknown quantization: {quantize}')
+
+
+def write_ply(path, mesh, quantize=None):
+    # little endian binary PLY with material and component (contact) index per face
+    positions, scale, offset = quantize_positions(mesh.vertices, quantize)
+    vertex_type = 'short' if positions.dtype.kind == 'i' else 'float'
+
+    faces = np.empty(len(mesh.faces), dtype=[('n', 'u1'), ('vertex_indices', '<i4', 3), ('material', 'u1'), ('component', '<i4')])
+    faces['n'] = 3
+    faces['vertex_indices'] = mesh.faces
+    faces['material'] = mesh.material_index
+    faces['component'] = mesh.component_index
+
+    header = ['ply', 'format binary_little_endian 1.0', f'comment generator electrode_geometry {electrode_geometry.GENERATOR_VERSION}']
+    if vertex_type == 'short':
+        header.append('comment quantization scale {!r} offset {!r} {!r} {!r}'.format(float(scale), *map(float, offset)))
+    header += [f'element vertex {len(positions)}', f'property {vertex_type} x', f'property {vertex_type} y', f'property {vertex_type} z',
+               f'element face {len(faces)}', 'property list uchar int vertex_indices', 'property uchar material', 'property int component',
+               'end_header']
+
+    with open(path, 'wb') as f:
+        f.write(('\n'.join(header) + '\n').encode('ascii'))
+        _write_array(f, positions)
+        _write_array(f, faces)
+
+
+def write_stl(path, mesh, quantize=None):
+    # binary STL, positions are always float32 (int16 is not possible in STL and falls back to float32)
+    positions, _, _ = quantize_positions(mesh.vertices, None)
+    triangles = positions[mesh.faces]
+    normals = np.cross(triangles[:, 1] - triangles[:, 0], triangles[:, 2] - triangles[:, 0])
+    lengths = np.linalg.norm(normals, axis=1, keepdims=True)
+    normals = normals / np.where(lengths > 0, lengths, 1)
+
+    records = np.zeros(len(triangles), dtype=[('normal', '<f4', 3), ('vertices', '<f4', (3, 3)), ('attribute', '<u2')])
+    records['normal'] = normals
+    records['vertices'] = triangles
+    records['attribute'] = mesh.material_index
+
+    header = f'electrode_geometry {electrode_geometry.GENERATOR_VERSION}'.encode('ascii').ljust(80, b' ')
+    with open(path, 'wb') as f:
+        f.write(header)
+        f.write(np.uint32(len(records)).astype('<u4').tobytes())
+        _write_array(f, records)
+
+
+def write_gltf(path, mesh, quantize=None, name='electrode'):
+    # glTF 2.0 (.gltf with a packed .bin buffer next to it), one primitive per material
+    positions, scale, offset = quantize_positions(mesh.vertices, quantize)
+    quantized = positions.dtype.kind == 'i'
+    if quantized:
+        # vertex attributes have to be 4 byte aligned: pad int16 xyz to 8 bytes per vertex
+        positions = np.concatenate((positions, np.zeros((len(positions), 1), dtype='<i2')), axis=1)
+
+    order = np.argsort(mesh.material_index, kind='stable')
+    materials, starts = np.unique(mesh.material_index[order], return_index=True)
+    ends = list(starts[1:]) + [len(order)]
+    indices = mesh.faces[order].astype('<u4')
+
+    buffer_views = [{'buffer': 0, 'byteOffset': 0, 'byteLength': positions.nbytes, 'target': 34962}]
+    if quantized:
+        buffer_views[0]['byteStride'] = 8
+        bounds = positions[:, :3] / 32767
+    else:
+        bounds = positions
+    accessors = [{'bufferView': 0, 'componentType': 5122 if quantized else 5126, 'normalized': quantized, 'count': len(positions),
+                  'type': 'VEC3', 'min': bounds.min(axis=0).tolist(), 'max': bounds.max(axis=0).tolist()}]
+    if not quantized:
+        del accessors[0]['normalized']
+
+    primitives = []
+    for material, start, end in zip(materials, starts, ends):
+        buffer_views.append({'buffer': 0, 'byteOffset': positions.nbytes + 12 * int(start), 'byteLength': 12 * int(end - start), 'target': 34963})
+        accessors.append({'bufferView': len(buffer_views) - 1, 'componentType': 5125, 'count': 3 * int(end - start), 'type': 'SCALAR'})
+        primitives.append({'attributes': {'POSITION': 0}, 'indices': len(accessors) - 1, 'material': int(material)})
+
+    bin_path = os.path.splitext(path)[0] + '.bin'
+    node = {'mesh': 0, 'name': name}
+    if quantized:
+        node.update(scale=[float(scale) * 32767] * 3, translation=offset.tolist())
+    gltf = {
+        'asset': {'version': '2.0', 'generator': f'electrode_geometry {electrode_geometry.GENERATOR_VERSION}'},
+        'scene': 0, 'scenes': [{'nodes': [0]}], 'nodes': [node],
+        'meshes': [{'name': name, 'primitives': primitives}],
+        'materials': [{'name': 'contact', 'pbrMetallicRoughness': {'baseColorFactor': [0.8, 0.8, 0.8, 1], 'metallicFactor': 1, 'roughnessFactor': 0.3}},
+                      {'name': 'insulation', 'pbrMetallicRoughness': {'baseColorFactor': [0.1, 0.1, 0.1, 1], 'metallicFactor': 0, 'roughnessFactor': 0.6}}],
+        'buffers': [{'uri': os.path.basename(bin_path), 'byteLength': positions.nbytes + indices.nbytes}],
+        'bufferViews': buffer_views, 'accessors': accessors,
+    }
+    if quantized:
+        gltf['extensionsUsed'] = gltf['extensionsRequired'] = ['KHR_mesh_quantization']
+
+    with open(bin_path, 'wb') as f:
+        _write_array(f, positions)
+        _write_array(f, indices)
+    with open(path, 'w') as f:
+        json.dump(gltf, f)
+
+
+writers = {'ply': write_ply, 'stl': write_stl, 'gltf': write_gltf}
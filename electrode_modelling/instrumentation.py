@@ -0,0 +1,229 @@
+import contextlib
+import functools
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+# stage recording for benchmarks: functions decorated with @stage only measure themselves while a StageRecorder is active
+# tracing: while a Tracer is active, every stage and every bpy.ops call is written as an event of a Chrome trace
+# (open the file in chrome://tracing or https://ui.perfetto.dev)
+# when neither is active, the decorator costs two global lookups per call
+
+_recorder = None
+_tracer = None
+_no_annotation = contextlib.nullcontext()
+operator_calls = 0  # bpy.ops calls since count_operators() was entered
+
+
+class StageRecorder:
+    # accumulates calls, wall time, peak traced memory, mesh sizes and operator calls per stage name
+
+    def __init__(self, trace_memory=False):
+        self.trace_memory = trace_memory
+        self.stages = {}
+        self._stack = []  # [traced memory at start, highest traced memory seen] of the running stages
+
+    def enter(self):
+        if self.trace_memory and tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            for frame in self._stack:
+                frame[1] = max(frame[1], peak)
+            tracemalloc.reset_peak()
+            self._stack.append([current, current])
+        return time.perf_counter(), operator_calls
+
+    def exit(self, name, started, result):
+        seconds = time.perf_counter() - started[0]
+        stats = self.stages.setdefault(name, {'calls': 0, 'seconds': 0.0, 'peak_bytes': 0, 'vertices': 0, 'faces': 0, 'operator_calls': 0})
+        stats['calls'] += 1
+        stats['seconds'] += seconds
+        stats['operator_calls'] += operator_calls - started[1]
+        if hasattr(result, 'vertices') and hasattr(result, 'faces'):
+            stats['vertices'] += len(result.vertices)
+            stats['faces'] += len(result.faces)
+        if self.trace_memory and tracemalloc.is_tracing():
+            frame = self._stack.pop()
+            frame[1] = max(frame[1], tracemalloc.get_traced_memory()[1])
+            if self._stack:
+                self._stack[-1][1] = max(self._stack[-1][1], frame[1])
+            stats['peak_bytes'] = max(stats['peak_bytes'], frame[1] - frame[0])
+
+
+@contextlib.contextmanager
+def recording(trace_memory=False):
+    global _recorder
+    previous = _recorder
+    _recorder = StageRecorder(trace_memory)
+    try:
+        yield _recorder
+    finally:
+        _recorder = previous
+
+
+def _active_mesh_size():
+    # (vertices, faces) of the active object in Blender, None outside of Blender or without an active mesh
+    bpy = sys.modules.get('bpy')
+    if bpy is None:
+        return None
+    obj = getattr(bpy.context, 'active_object', None)
+    if obj is None or obj.type != 'MESH':
+        return None
+    if obj.mode == 'EDIT':  # the mesh datablock is only updated when leaving edit mode
+        import bmesh
+        bm = bmesh.from_edit_mesh(obj.data)
+        return len(bm.verts), len(bm.faces)
+    return len(obj.data.vertices), len(obj.data.polygons)
+
+
+class Tracer:
+    # collects complete ('X') events of the trace_event format, args contain the current annotations (electrode, component)
+    # and the size of the active mesh before and after the event
+
+    def __init__(self):
+        self.events = []
+        self.annotations = {}
+        self._origin = time.perf_counter()
+
+    def begin(self):
+        return time.perf_counter(), _active_mesh_size()
+
+    def end(self, name, category, started, result=None):
+        end = time.perf_counter()
+        args = dict(self.annotations)
+        before, after = started[1], _active_mesh_size()
+        if before is not None or after is not None:
+            args.update(mesh_before=before, mesh_after=after)
+        if hasattr(result, 'vertices') and hasattr(result, 'faces'):
+            args.update(vertices=len(result.vertices), faces=len(result.faces))
+        self.events.append({'name': name, 'cat': category, 'ph': 'X', 'ts': 1e6 * (started[0] - self._origin),
+                            'dur': 1e6 * (end - started[0]), 'pid': os.getpid(), 'tid': threading.get_ident(), 'args': args})
+
+    def summary(self):
+        # calls, total, mean and maximum time (ms) per event name, slowest first
+        rows = {}
+        for event in self.events:
+            row = rows.setdefault((event['cat'], event['name']), {'category': event['cat'], 'name': event['name'], 'calls': 0, 'total_ms': 0.0, 'max_ms': 0.0})
+            row['calls'] += 1
+            row['total_ms'] += event['dur'] / 1000
+            row['max_ms'] = max(row['max_ms'], event['dur'] / 1000)
+        rows = sorted(rows.values(), key=lambda row: -row['total_ms'])
+        for row in rows:
+            row['mean_ms'] = row['total_ms'] / row['calls']
+        return rows
+
+    def format_summary(self):
+        lines = [f"{'category':10s} {'name':40s} {'calls':>7s} {'total ms':>10s} {'mean ms':>9s} {'max ms':>9s}"]
+        for row in self.summary():
+            lines.append(f"{row['category']:10s} {row['name']:40s} {row['calls']:7d} {row['total_ms']:10.2f} {row['mean_ms']:9.3f} {row['max_ms']:9.3f}")
+        return '\n'.join(lines)
+
+    def write(self, path):
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': self.events, 'displayTimeUnit': 'ms', 'otherData': {'summary': self.summary()}}, f)
+
+
+@contextlib.contextmanager
+def tracing(path=None):
+    # trace all stages and bpy.ops calls inside this context, write the trace to path (if given) and print the summary
+    global _tracer
+    previous = _tracer
+    _tracer = Tracer()
+    try:
+        with count_operators():
+            yield _tracer
+    finally:
+        tracer, _tracer = _tracer, previous
+        if path:
+            tracer.write(path)
+            print(tracer.format_summary())
+
+
+@contextlib.contextmanager
+def _annotated(tracer, values):
+    previous = dict(tracer.annotations)
+    tracer.annotations.update(values)
+    try:
+        yield
+    finally:
+        tracer.annotations = previous
+
+
+def annotate(**values):
+    # add values (e.g. electrode=..., component=...) to all events traced inside this context, does nothing when not tracing
+    if _tracer is None:
+        return _no_annotation
+    return _annotated(_tracer, values)
+
+
+def stage(name):
+    # name is a string or a function of the arguments of the decorated function that returns the stage name
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            recorder, tracer = _recorder, _tracer
+            if recorder is None and tracer is None:
+                return function(*args, **kwargs)
+            started = recorder.enter() if recorder is not None else None
+            traced = tracer.begin() if tracer is not None else None
+            result = None
+            try:
+                result = function(*args, **kwargs)
+                return result
+            finally:
+                stage_name = name(*args, **kwargs) if callable(name) else name
+                if recorder is not None:
+                    recorder.exit(stage_name, started, result)
+                if tracer is not None:
+                    tracer.end(stage_name, 'stage', traced, result)
+        return wrapper
+    return decorator
+
+
+class _CountingOperators:
+    # stands in for a bpy.ops submodule (bpy.ops.mesh, bpy.ops.object, ...), counts the operators called through it
+    # and traces them while tracing
+
+    def __init__(self, prefix, submodule):
+        self._prefix = prefix
+        self._submodule = submodule
+
+    def __getattr__(self, name):
+        operator = getattr(self._submodule, name)
+        operator_name = f'{self._prefix}.{name}'
+
+        def call(*args, **kwargs):
+            global operator_calls
+            operator_calls += 1
+            tracer = _tracer
+            if tracer is None:
+                return operator(*args, **kwargs)
+            traced = tracer.begin()
+            try:
+                return operator(*args, **kwargs)
+            finally:
+                tracer.end(operator_name, 'operator', traced)
+        return call
+
+
+@contextlib.contextmanager
+def count_operators(submodules=('mesh', 'object', 'curve')):
+    # count (and trace, see tracing) bpy.ops calls while inside this context, does nothing outside of Blender
+    global operator_calls
+    operator_calls = 0
+    try:
+        import bpy
+    except ImportError:
+        yield
+        return
+
+    originals = {name: getattr(bpy.ops, name) for name in submodules}
+    for name, submodule in originals.items():
+        setattr(bpy.ops, name, _CountingOperators(name, submodule))
+    try:
+        yield
+    finally:
+        for name, submodule in originals.items():
+            setattr(bpy.ops, name, submodule)
@@ -0,0 +1,87 @@
+import csv
+import json
+import os
+
+import numpy as np
+
+import electrode_layout
+
+# placement of many leads from reconstructed trajectories (e.g. Lead-DBS): every lead is given by its electrode type, head and
+# tail (centers of its deepest and most superficial contact level) and, for directional leads, the rotation around its axis
+# batch files are .json (list of {"electrode", "head", "tail", "rotation", "name"}) or .csv with the columns
+# electrode, head_x, head_y, head_z, tail_x, tail_y, tail_z and optionally rotation and name
+
+
+def read_trajectories(path):
+    # list of dicts with electrode, head (3), tail (3), rotation (degrees, 0 if not given) and name
+    if os.path.splitext(path)[1].lower() == '.csv':
+        with open(path, newline='') as f:
+            rows = [{'electrode': row['electrode'], 'name': row.get('name') or '',
+                     'head': [float(row[f'head_{c}']) for c in 'xyz'], 'tail': [float(row[f'tail_{c}']) for c in 'xyz'],
+                     'rotation': float(row.get('rotation') or 0)} for row in csv.DictReader(f)]
+    else:
+        with open(path) as f:
+            rows = json.load(f)
+
+    trajectories = []
+    for i, row in enumerate(rows):
+        head, tail = np.asarray(row['head'], dtype=np.float64), np.asarray(row['tail'], dtype=np.float64)
+        if head.shape != (3,) or tail.shape != (3,) or np.allclose(head, tail):
+            raise ValueError(f'{path}: lead {i} needs different 3D coordinates for head and tail')
+        trajectories.append({'electrode': row['electrode'], 'head': head, 'tail': tail, 'rotation': float(row.get('rotation') or 0),
+                             'name': row.get('name') or f"lead{i:03d}_{row['electrode']}"})
+    return trajectories
+
+
+def first_contact_center(elspec, name=''):
+    # z of the center of the deepest contact level of the model (which starts at z = 0 and runs along +z)
+    layout = electrode_layout.compile_layout(elspec, name)
+    rows = layout[(layout['contact_id'] >= 0) & (layout['level'] >= 0)]
+    row = rows[np.argmin(rows['z_start'])]
+    return (row['z_start'] + row['z_end']) / 2
+
+
+def lead_matrices(heads, tails, rotations=None, offsets=None):
+    # 4x4 matrices (n, 4, 4) that move models along +z onto their trajectories, computed for all leads at once
+    # +z of the model points from head to tail, the model point (0, 0, offset) lands on head (see first_contact_center)
+    # without rotation, +y of the model points to +y of the world (anterior) as far as the direction of the lead allows,
+    # rotation (degrees) turns the lead counterclockwise around its axis seen from the tail
+    heads = np.asarray(heads, dtype=np.float64).reshape(-1, 3)
+    tails = np.asarray(tails, dtype=np.float64).reshape(-1, 3)
+    n = len(heads)
+    rotations = np.radians(np.zeros(n) if rotations is None else np.asarray(rotations, dtype=np.float64))
+    offsets = np.zeros(n) if offsets is None else np.asarray(offsets, dtype=np.float64)
+
+    z = tails - heads
+    z /= np.linalg.norm(z, axis=1, keepdims=True)
+    reference = np.tile([0.0, 1.0, 0.0], (n, 1))
+    reference[np.abs(z[:, 1]) > 1 - 1e-6] = [1.0, 0.0, 0.0]  # lead along the y axis
+    y = reference - np.einsum('ij,ij->i', reference, z)[:, None] * z
+    y /= np.linalg.norm(y, axis=1, keepdims=True)
+    x = np.cross(y, z)
+
+    c, s = np.cos(rotations)[:, None], np.sin(rotations)[:, None]
+    x, y = c * x + s * y, c * y - s * x
+
+    matrices = np.zeros((n, 4, 4))
+    matrices[:, :3, 0], matrices[:, :3, 1], matrices[:, :3, 2] = x, y, z
+    matrices[:, :3, 3] = heads - offsets[:, None] * z
+    matrices[:, 3, 3] = 1
+    return matrices
+
+
+def assembly(trajectories, elspecs):
+    # {electrode type: (names, matrices)} of all leads in a list of trajectories, each type has to be built only once
+    groups = {}
+    for trajectory in trajectories:
+        groups.setdefault(trajectory['electrode'], []).append(trajectory)
+
+    leads = {}
+    for electrode, group in groups.items():
+        if electrode not in elspecs:
+            raise KeyError(f'{electrode} is not in the electrode specification')
+        offset = first_contact_center(elspecs[electrode], electrode)
+        matrices = lead_matrices([t['head'] for t in group], [t['tail'] for t in group], [t['rotation'] for t in group],
+                                 np.full(len(group), offset))
+        leads[electrode] = ([t['name'] for t in group], matrices)
+    return leads
@@ -0,0 +1,124 @@
+import hashlib
+import io
+import json
+import os
+import threading
+
+import numpy as np
+
+import electrode_geometry
+from electrode_geometry import MeshData
+
+
+def cache_key(elspec, nr_vertices, name='', chordal_tolerance=None):
+    # canonical hash of everything the generated mesh depends on
+    content = {'elspec': elspec, 'nr_vertices': nr_vertices, 'version': electrode_geometry.GENERATOR_VERSION,
+               'sensight': 'B33' in name, 'chordal_tolerance': chordal_tolerance}
+    return hashlib.sha256(json.dumps(content, sort_keys=True, separators=(',', ':')).encode()).hexdigest()
+
+
+class MeshCache:
+    # on-disk cache of generated electrodes (one .npz file per key), the least recently used files are evicted
+    # as soon as the cache grows beyond max_bytes
+    # the cache never fails a build: if the directory cannot be created or written, meshes are built without it
+
+    def __init__(self, directory, max_bytes=256 * 2 ** 20):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        try:
+            os.makedirs(directory, exist_ok=True)
+        except OSError as e:
+            print(f'electrode cache disabled: {e}')
+            self.directory = None
+
+    def path(self, key):
+        return os.path.join(self.directory, key + '.npz')
+
+    def get(self, key):
+        # returns (final, parts) like electrode_geometry.build_electrode, or None if the key is not cached
+        if self.directory is None:
+            return None
+        path = self.path(key)
+        try:
+            with np.load(path) as data:
+                arrays = {k: data[k] for k in data.files}
+            os.utime(path)  # mark as recently used
+        except (OSError, ValueError, KeyError):  # also evicted by another process or thread in the meantime
+            return None
+
+        final = MeshData(arrays['final_vertices'], arrays['final_faces'], arrays['final_material'], arrays['final_component'])
+        components = json.loads(str(arrays['components']))
+        vertex_offsets, face_offsets = arrays['vertex_offsets'], arrays['face_offsets']
+        parts = []
+        for i, component in enumerate(components):
+            faces = arrays['faces'][face_offsets[i]:face_offsets[i + 1]]
+            parts.append((component, MeshData(arrays['vertices'][vertex_offsets[i]:vertex_offsets[i + 1]], faces,
+                                              arrays['material'][face_offsets[i]:face_offsets[i + 1]], np.full(len(faces), i))))
+        return final, parts
+
+    def put(self, key, final, parts):
+        # returns False if the mesh could not be written (e.g. read-only folder or full disk)
+        if self.directory is None:
+            return False
+        vertex_offsets = np.cumsum([0] + [len(part.vertices) for _, part in parts])
+        face_offsets = np.cumsum([0] + [len(part.faces) for _, part in parts])
+        buffer = io.BytesIO()
+        np.savez(buffer,
+                 final_vertices=final.vertices.astype(np.float32), final_faces=final.faces.astype(np.int32),
+                 final_material=final.material_index.astype(np.uint8), final_component=final.component_index.astype(np.int16),
+                 vertices=np.concatenate([part.vertices for _, part in parts]).astype(np.float32),
+                 faces=np.concatenate([part.faces for _, part in parts]).astype(np.int32),
+                 material=np.concatenate([part.material_index for _, part in parts]).astype(np.uint8),
+                 vertex_offsets=vertex_offsets, face_offsets=face_offsets,
+                 components=np.array(json.dumps([component for component, _ in parts])))
+
+        # write to a temporary file first, so other processes and threads never see half-written files
+        path = self.path(key)
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(buffer.getbuffer())
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f'electrode cache: could not write {path}: {e}')
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            return False
+        self.evict()
+        return True
+
+    def evict(self):
+        entries = []
+        try:
+            scanned = list(os.scandir(self.directory))
+        except OSError:
+            return
+        for entry in scanned:
+            if entry.name.endswith('.npz'):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:  # also removed by another process, or not allowed
+                pass
+            total = total - size
+
+    def build(self, elspec, nr_vertices=72, name='', chordal_tolerance=None):
+        # same as electrode_geometry.build_electrode, but only generates the mesh if it is not cached yet
+        key = cache_key(elspec, nr_vertices, name, chordal_tolerance)
+        cached = self.get(key)
+        if cached is not None:
+            return cached
+        final, parts = electrode_geometry.build_electrode(elspec, nr_vertices, name, chordal_tolerance=chordal_tolerance)
+        self.put(key, final, parts)
+        return final, parts
@@ -0,0 +1,146 @@
+import argparse
+import json
+import math
+import os
+import sys
+import time
+
+import numpy as np
+
+import electrode_catalog
+import electrode_geometry
+import electrode_layout
+
+# geometric checks of generated electrodes against the values implied by their specification, on the vertex/face arrays only:
+# exposed surface area of every component of the final surface (e.g. for impedance models), enclosed volume, length of the
+# lead, non-manifold edges and duplicate vertices
+# the mesh approximates circles by polygons of nr_vertices and snaps segment borders to that grid (see sector_columns), so
+# every comparison allows for the error this causes at the resolution of the mesh on top of the tolerance
+# python metrics.py elspec.json "example_*" --resolution 16 72 --output metrics.json  (exit code 1 if any check fails)
+
+tolerance = 0.01  # relative error allowed on top of the discretization error
+duplicate_distance = 1e-6  # vertices closer than this count as duplicates
+
+
+def polygon_error(nr_vertices):
+    # relative area of the lateral surface of a cylinder that is lost with a polygon of nr_vertices (the area of the polygon,
+    # and so the volume, loses about four times as much)
+    return 1 - math.sin(math.pi / nr_vertices) / (math.pi / nr_vertices)
+
+
+def component_area(component, radius, top):
+    # analytic outer area of a component: cylinder (or half sphere with cylinder for the tip) minus its marker window,
+    # the component at the end of the lead also gets the top disk
+    length = component['z1'] - component['z0']
+    area = 2 * math.pi * radius * length
+    if component['kind'] in ('tip_contact', 'tip_insulation'):
+        area = 2 * math.pi * radius ** 2 + 2 * math.pi * radius * (length - radius)
+    if component['angles'] is not None:
+        area *= (component['angles'][1] - component['angles'][0]) / 360
+    if component['window'] is not None:
+        z_start, z_end, (start_angle, end_angle) = component['window']
+        area -= 2 * math.pi * radius * (z_end - z_start) * (end_angle - start_angle) / 360
+    if top:
+        area += math.pi * radius ** 2
+    return area
+
+
+def component_error(component, nr_vertices):
+    # discretization error of the area of a component, segments can lose or gain up to half a grid step at both borders
+    # the half sphere of the tip is a polygon in both directions
+    error = 4 * polygon_error(nr_vertices) if component['kind'] in ('tip_contact', 'tip_insulation') else polygon_error(nr_vertices)
+    extents = []
+    if component['angles'] is not None:
+        extents.append(component['angles'][1] - component['angles'][0])
+    if component['window'] is not None:
+        extents.append(component['window'][2][1] - component['window'][2][0])
+    # components without angular extent (only from specs that do not pass electrode_layout.validate_spec) are compared
+    # with an analytic area of 0 by check, without a relative error
+    error += sum((360 / nr_vertices) / extent for extent in extents if extent > 0)
+    return error
+
+
+def check(measured, expected, allowed):
+    error = (measured - expected) / expected if expected else float(measured != expected)
+    return {'measured': float(measured), 'analytic': float(expected), 'relative_error': float(error), 'ok': bool(abs(error) <= allowed)}
+
+
+def electrode_metrics(elspec, final, parts, nr_vertices):
+    # report of one electrode (final surface and parts of electrode_geometry.build_electrode) as a JSON compatible dict
+    radius = elspec['lead_diameter'] / 2
+    components = [component for component, _ in parts if component['kind'] != 'inner']
+    v = final.vertices[final.faces]
+    face_areas = np.linalg.norm(np.cross(v[:, 1] - v[:, 0], v[:, 2] - v[:, 0]), axis=1) / 2
+    areas = np.bincount(final.component_index, weights=face_areas, minlength=len(components))
+    last = max(range(len(components)), key=lambda i: components[i]['z1'])
+
+    report = {'areas': {}}
+    for i, component in enumerate(components):
+        report['areas'][component['name']] = dict(check(areas[i], component_area(component, radius, i == last),
+                                                        tolerance + component_error(component, nr_vertices)), kind=component['kind'])
+
+    volume = math.pi * radius ** 2 * (elspec['lead_length'] - radius) + 2 / 3 * math.pi * radius ** 3
+    report['volume'] = check(final.volume(), volume, tolerance + 4 * polygon_error(nr_vertices))
+    report['length'] = check(np.ptp(final.vertices[:, 2]) if len(final.vertices) else 0, elspec['lead_length'], tolerance)
+
+    non_manifold = final.non_manifold_edges()
+    duplicates = len(final.vertices) - len(electrode_geometry.merge_vertices(final.vertices, duplicate_distance)[1])
+    report['non_manifold_edges'] = {'measured': non_manifold, 'analytic': 0, 'ok': non_manifold == 0}
+    report['duplicate_vertices'] = {'measured': duplicates, 'analytic': 0, 'ok': duplicates == 0}
+
+    report['ok'] = all(item['ok'] for item in report['areas'].values()) and all(
+        report[key]['ok'] for key in ('volume', 'length', 'non_manifold_edges', 'duplicate_vertices'))
+    return report
+
+
+def failures(report):
+    # names of the failed checks of an electrode report
+    if 'error' in report:
+        return [report['error']]
+    failed = [f'area of {name}' for name, item in report['areas'].items() if not item['ok']]
+    return failed + [key for key in ('volume', 'length', 'non_manifold_edges', 'duplicate_vertices') if not report[key]['ok']]
+
+
+def main(argv=None):
+    global tolerance
+    parser = argparse.ArgumentParser(description='Check generated electrodes against the areas, volume and length of their specification.')
+    parser.add_argument('spec_file', nargs='?', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'elspec.json'),
+                        help='electrode specification (.json), default: elspec.json')
+    parser.add_argument('electrodes', nargs='*', default=['*'], help='electrode names or glob patterns (default: all)')
+    parser.add_argument('-r', '--resolution', type=int, nargs='+', default=[72], help='values of nr_vertices to check')
+    parser.add_argument('--tolerance', type=float, default=tolerance, help='relative error allowed on top of the discretization error')
+    parser.add_argument('-o', '--output', default='metrics.json', help='file for the report')
+    args = parser.parse_args(argv)
+    tolerance = args.tolerance
+
+    import batch_build
+    elspecs = electrode_catalog.ElectrodeCatalog(args.spec_file)
+    names = batch_build.select_electrodes(elspecs, args.electrodes)
+    if not names:
+        parser.error('no electrode matches ' + ' '.join(args.electrodes))
+
+    start = time.perf_counter()
+    results = []
+    for nr_vertices in args.resolution:
+        for name in names:
+            try:
+                final, parts = electrode_geometry.build_electrode(elspecs[name], nr_vertices, name)
+            except electrode_layout.SpecError as e:  # reported as failed, the other electrodes are still checked
+                report = dict(electrode=name, nr_vertices=nr_vertices, ok=False, error=str(e))
+            else:
+                report = dict(electrode=name, nr_vertices=nr_vertices, **electrode_metrics(elspecs[name], final, parts, nr_vertices))
+            results.append(report)
+            failed = failures(report)
+            print(f"{name} ({nr_vertices}): {'ok' if not failed else 'failed: ' + ', '.join(failed)}")
+
+    failed = sum(not report['ok'] for report in results)
+    with open(args.output, 'w') as f:
+        json.dump({'spec_file': os.path.abspath(args.spec_file), 'generator_version': electrode_geometry.GENERATOR_VERSION,
+                   'tolerance': tolerance, 'seconds': time.perf_counter() - start, 'checked': len(results), 'failed': failed,
+                   'results': results}, f, indent=2)
+    print(f'{len(results)} checked, {failed} failed in {time.perf_counter() - start:.2f} s')
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
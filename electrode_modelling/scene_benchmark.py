@@ -0,0 +1,76 @@
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+import bpy
+
+# build time of the electrode script in scenes of increasing size, to make sure it does not depend on the open file
+# run it in Blender: blender -b --python scene_benchmark.py -- --padding 0 1000 10000 --output scene_benchmark.json
+
+sys.path.append(str(Path(__file__).parent))
+
+
+def pad_scene(nr_objects):
+    # add dummy objects (all sharing one small mesh) to the scene until it holds nr_objects of them
+    collection = bpy.data.collections.get('padding')
+    if collection is None:
+        collection = bpy.data.collections.new('padding')
+        bpy.context.scene.collection.children.link(collection)
+    mesh = bpy.data.meshes.get('padding')
+    if mesh is None:
+        mesh = bpy.data.meshes.new('padding')
+        mesh.from_pydata([(0, 0, 0), (1, 0, 0), (0, 1, 0)], [], [(0, 1, 2)])
+    for i in range(len(collection.objects), nr_objects):
+        collection.objects.link(bpy.data.objects.new(f'padding{i}', mesh))
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description='Build time of the electrode script depending on the number of objects in the scene.')
+    parser.add_argument('--padding', type=int, nargs='+', default=[0, 1000, 10000], help='numbers of dummy objects in the scene')
+    parser.add_argument('--mode', nargs='+', default=['geometry', 'operators'], help='values of build_mode')
+    parser.add_argument('-e', '--electrodes', nargs='+', default=['example_non_directional_electrode', 'example_directional_electrode'])
+    parser.add_argument('-n', '--repeats', type=int, default=3, help='builds per electrode, the fastest one is kept')
+    parser.add_argument('-o', '--output', help='file for the results (.json)')
+    args = parser.parse_args(argv)
+
+    for module in ('add_curve_extra_objects',):  # curve.simple of the operator pipeline
+        try:
+            bpy.ops.preferences.addon_enable(module=module)
+        except Exception as e:
+            print(f'could not enable {module}: {e}')
+
+    import create_electrode_model
+    create_electrode_model.cache_dir = None
+
+    results = []
+    for nr_objects in sorted(args.padding):
+        pad_scene(nr_objects)
+        for mode in args.mode:
+            create_electrode_model.build_mode = mode
+            for electrode in args.electrodes:
+                times = []
+                for _ in range(args.repeats):
+                    # cold build: otherwise geometry mode reuses the objects, meshes and arrays of the previous repeat
+                    create_electrode_model.reset_build_state()
+                    start = time.perf_counter()
+                    create_electrode_model.construct_electrode(electrode)
+                    times.append(time.perf_counter() - start)
+                results.append({'padding': nr_objects, 'mode': mode, 'electrode': electrode, 'seconds': min(times)})
+                print(f'{nr_objects:6d} objects, {mode:10s} {electrode}: {1000 * min(times):.1f} ms')
+
+    # build time relative to the smallest scene
+    for result in results:
+        reference = next(r for r in results if r['mode'] == result['mode'] and r['electrode'] == result['electrode'])
+        result['relative'] = result['seconds'] / reference['seconds']
+    for result in results:
+        print(f"{result['padding']:6d} objects, {result['mode']:10s} {result['electrode']}: {result['relative']:.2f} x")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main(sys.argv[sys.argv.index('--') + 1:] if '--' in sys.argv else [])
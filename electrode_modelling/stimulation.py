@@ -0,0 +1,49 @@
+import os
+import re
+
+import numpy as np
+
+# stimulation amplitudes of the contacts over time (frames x contacts, column i is contact coni) as values per face of the
+# final mesh: every frame is a single gather from the amplitude table, the faces of insulations get 0
+
+
+def read_amplitudes(path):
+    # frames x contacts table from a .npy file or a .csv file (one row per frame, optional header)
+    if os.path.splitext(path)[1].lower() == '.npy':
+        amplitudes = np.load(path)
+    else:
+        with open(path) as f:
+            header = f.readline()
+        skip = 0 if re.fullmatch(r'[\s\d.,;eE+-]*', header) else 1
+        amplitudes = np.loadtxt(path, delimiter=',', skiprows=skip, ndmin=2)
+    amplitudes = np.asarray(amplitudes, dtype=np.float32)
+    if amplitudes.ndim == 1:
+        amplitudes = amplitudes[None]
+    if amplitudes.ndim != 2:
+        raise ValueError(f'{path}: amplitudes have to be a table of frames x contacts')
+    return amplitudes
+
+
+def contact_numbers(names):
+    # contact number of every component name ('con3' -> 3), -1 for insulations
+    return np.array([int(name[3:]) if re.fullmatch(r'con\d+', name) else -1 for name in names], dtype=np.int64)
+
+
+class AmplitudeAnimation:
+    # per-face amplitudes of one lead, component_index and names as stored with the final mesh (see MeshData.component_index)
+
+    def __init__(self, amplitudes, component_index, names):
+        self.amplitudes = np.asarray(amplitudes, dtype=np.float32).reshape(len(amplitudes), -1)
+        nr_contacts = self.amplitudes.shape[1]
+        contacts = contact_numbers(names)[np.asarray(component_index)]
+        # insulations and contacts without a column (e.g. the marker) read an extra column of zeros
+        self._columns = np.where((contacts >= 0) & (contacts < nr_contacts), contacts, nr_contacts)
+        self._padded = np.pad(self.amplitudes, ((0, 0), (0, 1)))
+
+    @property
+    def nr_frames(self):
+        return len(self.amplitudes)
+
+    def face_values(self, frame):
+        # amplitude of every face in a frame (frames before the first and after the last one keep the first/last values)
+        return self._padded[min(max(frame, 0), self.nr_frames - 1)][self._columns]
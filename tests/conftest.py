@@ -0,0 +1,26 @@
+import copy
+import os
+import shutil
+import sys
+
+import pytest
+
+# the modules of the generator are plain scripts next to each other, imported by name like in Blender
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'electrode_modelling'))
+
+import electrode_catalog  # noqa: E402
+
+
+@pytest.fixture
+def spec_file(tmp_path):
+    # copy of the example spec file, so the index of the catalog (elspec.json.index) is not written into the source tree
+    path = tmp_path / 'elspec.json'
+    shutil.copyfile(os.path.join(os.path.dirname(electrode_catalog.__file__), 'elspec.json'), path)
+    return str(path)
+
+
+@pytest.fixture
+def load_elspec(spec_file):
+    # function name -> copy of the spec of an example electrode, which the test may change
+    elspecs = electrode_catalog.ElectrodeCatalog(spec_file)
+    return lambda name: copy.deepcopy(elspecs[name])
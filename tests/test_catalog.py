@@ -0,0 +1,93 @@
+import hashlib
+import json
+import os
+
+import pytest
+
+import electrode_catalog
+
+SPECS = {'plain': {'lead_diameter': 1.3, 'note': 'ascii'},
+         'électrode_ü': {'lead_diameter': 1.27, 'note': 'kontakt ø 1,27 mm — 電極'},
+         '😀': {'nested': {'list': [1, 2.5, None, True, '}{"']}},
+         'last': {'lead_diameter': 0.8}}
+
+
+def write(path, specs, indent=1):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(specs, f, indent=indent, ensure_ascii=False)
+
+
+def test_scan_of_non_ascii_file_gives_byte_offsets(tmp_path):
+    path = tmp_path / 'specs.json'
+    write(path, SPECS)
+    data = path.read_bytes()
+    ranges = electrode_catalog.scan(data)
+    assert list(ranges) == list(SPECS)
+    for name, (start, end) in ranges.items():
+        assert json.loads(data[start:end]) == SPECS[name]
+
+
+def test_catalog_reads_non_ascii_electrodes(tmp_path):
+    path = str(tmp_path / 'specs.json')
+    write(path, SPECS)
+    elspecs = electrode_catalog.ElectrodeCatalog(path)
+    assert dict(elspecs) == SPECS
+    assert os.path.exists(path + '.index')
+    # a second catalog uses the index written by the first one
+    assert electrode_catalog.ElectrodeCatalog(path)['électrode_ü'] == SPECS['électrode_ü']
+
+
+@pytest.mark.parametrize('data', [b'{"a": 1} trailing', b'{"a": 1}}', b'{"a": 1', b'{"a" 1}', b'[1, 2]'])
+def test_scan_rejects_malformed_files(data):
+    with pytest.raises(ValueError):
+        electrode_catalog.scan(data)
+
+
+@pytest.mark.parametrize('data', [b'{}', b' {"a": 1}\n\n', b'{"a": 1, "b": {"c": [1, "}"]}}'])
+def test_scan_accepts_what_json_accepts(data):
+    ranges = electrode_catalog.scan(data)
+    assert {name: json.loads(data[start:end]) for name, (start, end) in ranges.items()} == json.loads(data)
+
+
+def test_spec_hash(tmp_path):
+    path = str(tmp_path / 'specs.json')
+    write(path, SPECS)
+    with open(path, 'rb') as f:
+        data = f.read()
+    elspecs = electrode_catalog.ElectrodeCatalog(path)
+    for name, (start, end) in electrode_catalog.scan(data).items():
+        assert elspecs.spec_hash(name) == hashlib.sha256(data[start:end]).hexdigest()
+    assert len({elspecs.spec_hash(name) for name in SPECS}) == len(SPECS)
+
+
+def test_index_is_rebuilt_when_the_file_changes(tmp_path):
+    path = str(tmp_path / 'specs.json')
+    write(path, SPECS)
+    elspecs = electrode_catalog.ElectrodeCatalog(path)
+    hashes = {name: elspecs.spec_hash(name) for name in elspecs}
+    assert elspecs['plain']['lead_diameter'] == 1.3
+
+    # same size, only the modification time tells the catalog that the file changed
+    write(path, dict(SPECS, plain={'lead_diameter': 1.4, 'note': 'ascii'}))
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+    assert elspecs['plain']['lead_diameter'] == 1.4
+    assert elspecs.spec_hash('plain') != hashes['plain']
+    assert all(elspecs.spec_hash(name) == hashes[name] for name in SPECS if name != 'plain')
+    with open(path + '.index') as f:
+        assert json.load(f)['stat'] == [os.stat(path).st_size, os.stat(path).st_mtime_ns]
+    # a new catalog sees the new version as well
+    assert electrode_catalog.ElectrodeCatalog(path)['plain']['lead_diameter'] == 1.4
+
+
+def test_new_and_removed_electrodes(tmp_path):
+    path = str(tmp_path / 'specs.json')
+    write(path, SPECS)
+    elspecs = electrode_catalog.ElectrodeCatalog(path)
+    assert 'new' not in elspecs and len(elspecs) == len(SPECS)
+
+    write(path, {'new': {'lead_diameter': 1}, 'last': SPECS['last']}, indent=None)
+    assert 'new' in elspecs and 'plain' not in elspecs and len(elspecs) == 2
+    with pytest.raises(KeyError):
+        elspecs['plain']
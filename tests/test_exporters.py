@@ -0,0 +1,109 @@
+import json
+
+import numpy as np
+import pytest
+
+import electrode_geometry
+import exporters
+
+PLY_FACE = np.dtype([('n', 'u1'), ('vertex_indices', '<i4', 3), ('material', 'u1'), ('component', '<i4')])
+STL_RECORD = np.dtype([('normal', '<f4', 3), ('vertices', '<f4', (3, 3)), ('attribute', '<u2')])
+
+
+@pytest.fixture
+def mesh(load_elspec):
+    final, _ = electrode_geometry.build_electrode(load_elspec('example_directional_electrode'), 16, 'example_directional_electrode')
+    return final
+
+
+def read_ply(path):
+    # (header lines, body) of a binary PLY file
+    data = path.read_bytes()
+    end = data.index(b'end_header\n') + len(b'end_header\n')
+    return data[:end].decode('ascii').splitlines(), data[end:]
+
+
+@pytest.mark.parametrize('quantize', [None, 'int16'])
+def test_ply(tmp_path, mesh, quantize):
+    path = tmp_path / 'electrode.ply'
+    exporters.write_ply(path, mesh, quantize)
+    header, body = read_ply(path)
+    nv, nf = len(mesh.vertices), len(mesh.faces)
+    assert f'element vertex {nv}' in header and f'element face {nf}' in header
+    vertex_size = 6 if quantize else 12
+    assert len(body) == nv * vertex_size + nf * 18
+
+    faces = np.frombuffer(body[nv * vertex_size:], dtype=PLY_FACE)
+    assert (faces['n'] == 3).all()
+    assert np.array_equal(faces['vertex_indices'], mesh.faces)
+    assert np.array_equal(faces['material'], mesh.material_index)
+    assert np.array_equal(faces['component'], mesh.component_index)
+
+    if quantize:
+        comment = next(line for line in header if line.startswith('comment quantization')).split()
+        scale, offset = float(comment[3]), np.array(comment[5:8], dtype=float)
+        positions = np.frombuffer(body[:nv * 6], dtype='<i2').reshape(-1, 3) * scale + offset
+        assert np.abs(positions - mesh.vertices).max() <= scale / 2 + 1e-12
+    else:
+        positions = np.frombuffer(body[:nv * 12], dtype='<f4').reshape(-1, 3)
+        assert np.allclose(positions, mesh.vertices, atol=1e-5)
+
+
+def test_stl(tmp_path, mesh):
+    path = tmp_path / 'electrode.stl'
+    exporters.write_stl(path, mesh)
+    data = path.read_bytes()
+    nf = len(mesh.faces)
+    assert len(data) == 80 + 4 + 50 * nf
+    assert np.frombuffer(data[80:84], dtype='<u4')[0] == nf
+
+    records = np.frombuffer(data[84:], dtype=STL_RECORD)
+    assert np.allclose(records['vertices'], mesh.vertices[mesh.faces], atol=1e-5)
+    assert np.array_equal(records['attribute'], mesh.material_index)
+    assert np.allclose(np.linalg.norm(records['normal'], axis=1), 1, atol=1e-5)
+
+
+@pytest.mark.parametrize('quantize', [None, 'int16'])
+def test_gltf(tmp_path, mesh, quantize):
+    path = tmp_path / 'electrode.gltf'
+    exporters.write_gltf(path, mesh, quantize)
+    gltf = json.loads(path.read_text())
+    data = (tmp_path / gltf['buffers'][0]['uri']).read_bytes()
+    assert gltf['buffers'][0]['byteLength'] == len(data)
+
+    # positions first, then the indices of every material, without gaps
+    views, accessors = gltf['bufferViews'], gltf['accessors']
+    offset = 0
+    for view in views:
+        assert view['byteOffset'] == offset and view['byteOffset'] % 4 == 0
+        offset += view['byteLength']
+    assert offset == len(data)
+
+    position = accessors[0]
+    nv = len(mesh.vertices)
+    assert position['count'] == nv
+    if quantize:
+        assert position['componentType'] == 5122 and position['normalized'] and views[0]['byteStride'] == 8
+        assert gltf['extensionsRequired'] == ['KHR_mesh_quantization']
+        node = gltf['nodes'][0]
+        stored = np.frombuffer(data[:views[0]['byteLength']], dtype='<i2').reshape(-1, 4)[:, :3]
+        positions = stored / 32767 * np.array(node['scale']) + np.array(node['translation'])
+        assert np.abs(positions - mesh.vertices).max() <= node['scale'][0] / 32767 / 2 + 1e-12
+        assert np.allclose(position['min'], stored.min(axis=0) / 32767) and np.allclose(position['max'], stored.max(axis=0) / 32767)
+    else:
+        assert position['componentType'] == 5126 and views[0]['byteLength'] == nv * 12
+        positions = np.frombuffer(data[:views[0]['byteLength']], dtype='<f4').reshape(-1, 3)
+        assert np.allclose(positions, mesh.vertices, atol=1e-5)
+        assert np.allclose(position['min'], positions.min(axis=0)) and np.allclose(position['max'], positions.max(axis=0))
+
+    # one primitive per material, together they hold every face once
+    faces = []
+    for primitive in gltf['meshes'][0]['primitives']:
+        accessor = accessors[primitive['indices']]
+        view = views[accessor['bufferView']]
+        assert accessor['componentType'] == 5125 and accessor['count'] * 4 == view['byteLength']
+        indices = np.frombuffer(data[view['byteOffset']:view['byteOffset'] + view['byteLength']], dtype='<u4').reshape(-1, 3)
+        assert (mesh.material_index == primitive['material']).sum() == len(indices)
+        faces.append(indices)
+    order = np.argsort(mesh.material_index, kind='stable')
+    assert np.array_equal(np.concatenate(faces), mesh.faces[order])
@@ -0,0 +1,190 @@
+import math
+
+import numpy as np
+import pytest
+
+import electrode_geometry
+from metrics import polygon_error
+
+# the analytic components of geometry mode against their closed form: hollow parts are annular solids between the inner
+# bore (radius / 2) and the lead radius, the tip is a half sphere and cylinder with the bore and the marker an annulus
+# without its window, which the booleans of the operator pipeline cut as well
+# the comparison with the boolean components themselves needs Blender, see compare_with_geometry in create_electrode_model.py
+
+ELECTRODES = ['example_non_directional_electrode', 'example_directional_electrode']
+HOLLOW = ('contact', 'insulation', 'segment', 'gap')
+
+
+@pytest.fixture
+def build(load_elspec):
+    # function (name, nr_vertices) -> radius, (final, parts) of an example electrode
+    def build(name, nr_vertices):
+        elspec = load_elspec(name)
+        return elspec['lead_diameter'] / 2, electrode_geometry.build_electrode(elspec, nr_vertices, name)
+    return build
+
+
+def relative_error(measured, expected):
+    return abs(measured - expected) / expected
+
+
+@pytest.mark.parametrize('nr_vertices', [16, 72])
+@pytest.mark.parametrize('name', ELECTRODES)
+def test_parts_are_closed(build, name, nr_vertices):
+    _, (final, parts) = build(name, nr_vertices)
+    assert final.non_manifold_edges() == 0
+    for component, part in parts:
+        assert part.non_manifold_edges() == 0, component['name']
+
+
+@pytest.mark.parametrize('nr_vertices', [16, 72])
+@pytest.mark.parametrize('name', ELECTRODES)
+def test_hollow_parts_match_annulus(build, name, nr_vertices):
+    # volume pi (r^2 - r_i^2) L and area of the walls and caps, times the angular fraction for segments and gaps (snapped to
+    # the grid), the polygons of nr_vertices lose at most 4 * polygon_error of both
+    radius, (_, parts) = build(name, nr_vertices)
+    radius_inner = radius / 2
+    checked = 0
+    for component, part in parts:
+        if component['kind'] not in HOLLOW:
+            continue
+        length = component['z1'] - component['z0']
+        fraction, sides = 1, 0
+        if component['angles'] is not None:
+            start_angle, end_angle = electrode_geometry.component_angles(component, nr_vertices)
+            fraction, sides = (end_angle - start_angle) / 360, 2 * (radius - radius_inner) * length
+        volume = fraction * math.pi * (radius ** 2 - radius_inner ** 2) * length
+        area = fraction * (2 * math.pi * (radius + radius_inner) * length + 2 * math.pi * (radius ** 2 - radius_inner ** 2)) + sides
+
+        assert part.volume() <= volume and relative_error(part.volume(), volume) <= 4 * polygon_error(nr_vertices), component['name']
+        assert part.area() <= area and relative_error(part.area(), area) <= 4 * polygon_error(nr_vertices), component['name']
+        checked += 1
+    assert checked
+
+
+@pytest.mark.parametrize('name', ELECTRODES)
+def test_inner_bore(build, name):
+    radius, (_, parts) = build(name, 72)
+    component, part = parts[-1]
+    assert component['kind'] == 'inner'
+    volume = math.pi * (radius / 2) ** 2 * (component['z1'] - component['z0'])
+    assert relative_error(part.volume(), volume) <= 4 * polygon_error(72)
+
+
+@pytest.mark.parametrize('nr_vertices', [16, 72])
+@pytest.mark.parametrize('num_segments, size_segments, start_angle', [(4, 60, None), (8, 30, None), (4, 60, 15), (8, 30, 100)])
+def test_segmented_levels_are_closed(load_elspec, nr_vertices, num_segments, size_segments, start_angle):
+    # all segments and gaps of a level are built in one pass (see sector_solids), also for other numbers of segments
+    elspec = load_elspec('example_directional_electrode')
+    for level_nr in ('1', '2'):
+        level = elspec['contact_specification'][level_nr]
+        level.update(num_segments=num_segments, size_segments=size_segments)
+        if start_angle is not None:
+            level['start_angle'] = start_angle
+
+    final, parts = electrode_geometry.build_electrode(elspec, nr_vertices, 'segmented')
+    assert final.non_manifold_edges() == 0
+    assert sum(component['kind'] == 'segment' for component, _ in parts) == 2 * num_segments
+    assert sum(component['kind'] == 'gap' for component, _ in parts) == 2 * num_segments
+    for component, part in parts:
+        assert part.non_manifold_edges() == 0, component['name']
+
+
+def sector_loss(start_angle, end_angle, nr_vertices):
+    # relative area lost by a polygon approximating a sector with the angular resolution of electrode_geometry._arc
+    sides = max(1, round(nr_vertices * (end_angle - start_angle) / 360))
+    step = math.radians(end_angle - start_angle) / sides
+    return 1 - math.sin(step) / step
+
+
+@pytest.mark.parametrize('nr_vertices', [16, 72, 144])
+@pytest.mark.parametrize('name', ELECTRODES)
+def test_tip_matches_half_sphere_with_bore(build, name, nr_vertices):
+    # half sphere and cylinder up to the tip length L, minus the inner bore from r / 3 (what the booleans cut from the sphere
+    # and the bore): 2/3 pi r^3 + pi r^2 (L - r) - pi (r / 2)^2 (L - r / 3)
+    # the half sphere is a polygon around the axis and along its meridians, so it loses up to twice as much
+    radius, (_, parts) = build(name, nr_vertices)
+    component, part = parts[0]
+    assert component['kind'] in ('tip_contact', 'tip_insulation')
+    length = component['z1'] - component['z0']
+    volume = (2 / 3 * math.pi * radius ** 3 + math.pi * radius ** 2 * (length - radius)
+              - math.pi * (radius / 2) ** 2 * (length - electrode_geometry.bore_start * radius))
+    assert part.volume() <= volume and relative_error(part.volume(), volume) <= 8 * polygon_error(nr_vertices)
+
+
+@pytest.mark.parametrize('nr_vertices', [16, 72, 144])
+def test_marker_matches_annulus_without_window(build, nr_vertices):
+    # marker: annulus of its length minus the sector of the window, window: that sector (what the boolean cuts out)
+    radius, (_, parts) = build('example_directional_electrode', nr_vertices)
+    annulus = math.pi * (radius ** 2 - (radius / 2) ** 2)
+    components = {component['kind']: (component, part) for component, part in parts}
+    marker, marker_part = components['marker']
+    window, window_part = components['window']
+
+    z_start, z_end, (start_angle, end_angle) = marker['window']
+    assert (window['z0'], window['z1'], tuple(window['angles'])) == (z_start, z_end, (start_angle, end_angle))
+    full = annulus * (marker['z1'] - marker['z0'])
+    cut = annulus * (z_end - z_start) * (end_angle - start_angle) / 360
+    loss = sector_loss(start_angle, end_angle, nr_vertices)
+
+    assert window_part.non_manifold_edges() == 0 and marker_part.non_manifold_edges() == 0
+    assert relative_error(window_part.volume(), cut) <= loss + 1e-9
+    # the full circle and the window lose differently, at most both losses relative to the remaining volume
+    assert relative_error(marker_part.volume(), full - cut) <= (full * 4 * polygon_error(nr_vertices) + cut * loss) / (full - cut)
+
+
+def brute_force_groups(vertices, distance):
+    # connected groups of the vertices closer than distance, by comparing all pairs
+    labels = np.arange(len(vertices))
+    close = np.linalg.norm(vertices[:, None] - vertices[None], axis=2) <= distance
+    for _ in range(len(vertices)):
+        updated = np.where(close, labels[None], len(vertices)).min(axis=1)
+        if np.array_equal(updated, labels):
+            break
+        labels = updated
+    return labels
+
+
+def same_partition(a, b):
+    # True if the labels a and b group the vertices in the same way
+    return len(np.unique(a)) == len(np.unique(b)) == len(np.unique(np.column_stack((a, b)), axis=0))
+
+
+@pytest.mark.parametrize('offset', [(1, 0, 0), (0, 1, 0), (0, 0, 1), (1, 1, 0), (1, 1, 1), (-1, 1, -1)])
+def test_merge_across_cell_border(offset):
+    # cells of 0.01 are centered on multiples of 0.01, so 0.0049999 and 0.0050001 are in neighbouring cells
+    offset = np.array(offset)
+    vertices = np.array([0.0049999 * offset, 0.0050001 * offset, [1, 1, 1]])
+    index, merged = electrode_geometry.merge_vertices(vertices, 0.01)
+    assert index[0] == index[1] != index[2]
+    assert len(merged) == 2
+
+
+def test_merge_keeps_distant_vertices():
+    index, merged = electrode_geometry.merge_vertices([[0, 0, 0], [0.02, 0, 0], [0, 0.015, 0]], 0.01)
+    assert len(merged) == 3 and len(set(index)) == 3
+
+
+@pytest.mark.parametrize('seed', range(5))
+@pytest.mark.parametrize('scale', [1, 1e6])
+def test_merge_matches_brute_force(seed, scale):
+    # clusters of nearby vertices (less than distance / 2 across) that are further than 4 * distance apart, placed at
+    # random on the grid, the clusters are found as with all pairwise distances (also for coordinates far from the origin)
+    rng = np.random.default_rng(seed)
+    distance = 0.01
+    centers = np.unique(rng.integers(0, 40, size=(150, 3)), axis=0) * 5 * distance + scale
+    vertices = np.repeat(centers, rng.integers(1, 4, size=len(centers)), axis=0)
+    vertices = vertices + rng.uniform(-distance / 4, distance / 4, size=vertices.shape) / math.sqrt(3)
+    vertices = vertices[rng.permutation(len(vertices))]
+
+    index, merged = electrode_geometry.merge_vertices(vertices, distance)
+    assert same_partition(index, brute_force_groups(vertices, distance))
+    assert np.linalg.norm(merged[index] - vertices, axis=1).max() <= distance
+
+
+def test_merge_of_example_electrodes(build):
+    # the final surfaces are watertight without merging, so there is nothing to merge
+    for name in ELECTRODES:
+        _, (final, _) = build(name, 72)
+        index, merged = electrode_geometry.merge_vertices(final.vertices, 1e-6)
+        assert len(merged) == len(final.vertices)
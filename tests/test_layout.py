@@ -0,0 +1,51 @@
+import pytest
+
+import electrode_catalog
+import electrode_layout
+
+
+@pytest.fixture
+def elspec(load_elspec):
+    return load_elspec('example_non_directional_electrode')
+
+
+@pytest.fixture
+def directional_elspec(load_elspec):
+    return load_elspec('example_directional_electrode')
+
+
+def test_example_electrodes_are_valid(spec_file):
+    elspecs = electrode_catalog.ElectrodeCatalog(spec_file)
+    for name in elspecs:
+        electrode_layout.validate_spec(elspecs[name], name)
+
+
+@pytest.mark.parametrize('spacing', [[0], [0.5, 0, 0.5], [-0.5], []])
+def test_contact_spacing_has_to_be_positive(elspec, spacing):
+    elspec['contact_spacing'] = spacing
+    with pytest.raises(electrode_layout.SpecError, match='contact_spacing'):
+        electrode_layout.validate_spec(elspec, 'spacing')
+
+
+@pytest.mark.parametrize('num_segments, size_segments', [(3, 120), (4, 90), (8, 45), (8, 50)])
+def test_segments_have_to_leave_room_for_insulation(directional_elspec, num_segments, size_segments):
+    # segments covering the whole circle would leave gaps of zero width between them
+    level = directional_elspec['contact_specification']['1']
+    level.update(num_segments=num_segments, size_segments=size_segments)
+    with pytest.raises(electrode_layout.SpecError, match='size_segments'):
+        electrode_layout.validate_spec(directional_elspec, 'full_coverage')
+
+
+@pytest.mark.parametrize('marker_pos', [2.0, 7.5])
+def test_marker_has_to_start_after_the_levels(directional_elspec, marker_pos):
+    # the levels and spacings of the directional example end at 7.5 mm
+    directional_elspec['marker_pos'] = marker_pos
+    with pytest.raises(electrode_layout.SpecError, match='marker_pos'):
+        electrode_layout.compile_layout(directional_elspec, 'overlapping_marker')
+
+
+def test_sensight_marker_warns_instead_of_printing(directional_elspec, capsys):
+    with pytest.warns(UserWarning, match='Sensight'):
+        layout = electrode_layout.compile_layout(directional_elspec, 'B33_example')
+    assert capsys.readouterr().out == ''
+    assert electrode_layout.MARKER not in layout['kind']
@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+
+import lead_assembly
+
+
+def random_leads(n, seed=0):
+    rng = np.random.default_rng(seed)
+    heads = rng.normal(size=(n, 3)) * 20
+    tails = heads + rng.normal(size=(n, 3)) * 30
+    tails[0] = heads[0] + [0, 40, 0]  # along the y axis
+    tails[1] = heads[1] - [0, 0, 40]  # pointing down
+    return heads, tails, rng.uniform(-180, 180, n), rng.uniform(0, 3, n)
+
+
+def test_matrices_are_rotations():
+    heads, tails, rotations, offsets = random_leads(50)
+    matrices = lead_assembly.lead_matrices(heads, tails, rotations, offsets)
+    rotation = matrices[:, :3, :3]
+    assert np.allclose(rotation.transpose(0, 2, 1) @ rotation, np.eye(3))
+    assert np.allclose(np.linalg.det(rotation), 1)
+    assert np.allclose(matrices[:, 3], [0, 0, 0, 1])
+
+
+def test_first_contact_center_lands_on_head():
+    heads, tails, rotations, offsets = random_leads(50)
+    matrices = lead_assembly.lead_matrices(heads, tails, rotations, offsets)
+    centers = np.column_stack((np.zeros((50, 2)), offsets, np.ones(50)))
+    assert np.allclose(np.einsum('nij,nj->ni', matrices, centers)[:, :3], heads)
+    # +z of the model points from head to tail
+    direction = (tails - heads) / np.linalg.norm(tails - heads, axis=1, keepdims=True)
+    assert np.allclose(matrices[:, :3, 2], direction)
+
+
+def test_rotation_is_counterclockwise_seen_from_the_tail():
+    heads, tails, _, _ = random_leads(50)
+    unrotated = lead_assembly.lead_matrices(heads, tails)
+    rotated = lead_assembly.lead_matrices(heads, tails, np.full(50, 90.0))
+    assert np.allclose(rotated[:, :3, 0], unrotated[:, :3, 1])
+    assert np.allclose(rotated[:, :3, 2], unrotated[:, :3, 2])
+    assert np.allclose(rotated[:, :3, 3], unrotated[:, :3, 3])
+
+
+def test_without_rotation_y_points_anterior():
+    matrices = lead_assembly.lead_matrices([[0, 0, 0]], [[1, 0, 1]])
+    assert np.allclose(matrices[0, :3, 1], [0, 1, 0])
+
+
+def test_assembly_groups_leads_by_type(load_elspec):
+    elspecs = {name: load_elspec(name) for name in ('example_non_directional_electrode', 'example_directional_electrode')}
+    trajectories = [{'electrode': electrode, 'head': np.array([i, 0.0, 0.0]), 'tail': np.array([i, 0.0, 10.0]), 'rotation': 0, 'name': f'lead{i}'}
+                    for i, electrode in enumerate(['example_directional_electrode', 'example_non_directional_electrode',
+                                                   'example_directional_electrode'])]
+    leads = lead_assembly.assembly(trajectories, elspecs)
+    names, matrices = leads['example_directional_electrode']
+    assert names == ['lead0', 'lead2'] and matrices.shape == (2, 4, 4)
+
+    offset = lead_assembly.first_contact_center(elspecs['example_directional_electrode'])
+    assert np.allclose(matrices[:, :3, :3] @ [0, 0, offset] + matrices[:, :3, 3], [[0, 0, 0], [2, 0, 0]])
+    with pytest.raises(KeyError):
+        lead_assembly.assembly([dict(trajectories[0], electrode='unknown')], elspecs)
+
+
+def test_read_csv_trajectories(tmp_path):
+    path = tmp_path / 'leads.csv'
+    path.write_text('name,electrode,head_x,head_y,head_z,tail_x,tail_y,tail_z,rotation\n'
+                    'left,example_directional_electrode,1,2,3,4,5,6,30\n'
+                    ',example_non_directional_electrode,0,0,0,0,0,1,\n')
+    trajectories = lead_assembly.read_trajectories(str(path))
+    assert [t['name'] for t in trajectories] == ['left', 'lead001_example_non_directional_electrode']
+    assert np.array_equal(trajectories[0]['tail'], [4, 5, 6]) and trajectories[0]['rotation'] == 30
+    assert trajectories[1]['rotation'] == 0
@@ -0,0 +1,38 @@
+import os
+
+import pytest
+
+import electrode_geometry
+import mesh_cache
+
+NAME = 'example_non_directional_electrode'
+
+
+@pytest.fixture
+def elspec(load_elspec):
+    return load_elspec(NAME)
+
+
+def test_build_is_cached(tmp_path, elspec):
+    cache = mesh_cache.MeshCache(str(tmp_path / 'cache'))
+    final, parts = cache.build(elspec, 16, NAME)
+    assert len(os.listdir(tmp_path / 'cache')) == 1
+    cached, cached_parts = cache.build(elspec, 16, NAME)
+    assert len(cached.faces) == len(final.faces) and len(cached_parts) == len(parts)
+
+
+def test_directory_that_cannot_be_created(tmp_path, elspec):
+    # the cache folder would be inside a file
+    (tmp_path / 'file').write_text('')
+    cache = mesh_cache.MeshCache(str(tmp_path / 'file' / 'cache'))
+    final, _ = cache.build(elspec, 16, NAME)
+    assert len(final.faces) == len(electrode_geometry.build_electrode(elspec, 16, NAME)[0].faces)
+
+
+def test_directory_that_cannot_be_written(tmp_path, elspec):
+    cache = mesh_cache.MeshCache(str(tmp_path / 'cache'))
+    os.rmdir(tmp_path / 'cache')
+    (tmp_path / 'cache').write_text('')  # replaced by a file after the cache was created
+    final, parts = cache.build(elspec, 16, NAME)
+    assert len(final.faces) and parts
+    assert not cache.put('key', final, parts)
@@ -0,0 +1,35 @@
+import json
+
+import pytest
+
+import metrics
+
+
+def full_coverage_spec(load_elspec):
+    # directional electrode whose segments cover the whole circle (no insulation between them)
+    elspec = load_elspec('example_directional_electrode')
+    for level in elspec['contact_specification'].values():
+        if level.get('segmented'):
+            level['size_segments'] = 360 / level['num_segments']
+    return elspec
+
+
+def test_component_error_of_zero_extent():
+    component = {'kind': 'gap', 'angles': (120.0, 120.0), 'window': None}
+    assert metrics.component_error(component, 72) == metrics.polygon_error(72)
+
+
+def test_report_is_written_for_full_coverage_level(tmp_path, load_elspec):
+    spec_file = tmp_path / 'elspec.json'
+    spec_file.write_text(json.dumps({'full_coverage': full_coverage_spec(load_elspec)}))
+    output = tmp_path / 'metrics.json'
+    assert metrics.main([str(spec_file), '--output', str(output)]) == 1
+
+    report = json.loads(output.read_text())
+    assert report['checked'] == 1 and report['failed'] == 1
+    assert 'size_segments' in report['results'][0]['error']
+
+
+@pytest.mark.parametrize('nr_vertices', [16, 72])
+def test_example_electrodes_pass(tmp_path, spec_file, nr_vertices):
+    assert metrics.main([spec_file, '--resolution', str(nr_vertices), '--output', str(tmp_path / 'metrics.json')]) == 0
@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+
+import electrode_geometry
+import stimulation
+
+NAME = 'example_directional_electrode'
+
+
+@pytest.fixture
+def final(load_elspec):
+    # final surface and component names of a directional lead with a marker
+    final, parts = electrode_geometry.build_electrode(load_elspec(NAME), 16, NAME)
+    return final, [component for component, _ in parts]
+
+
+def test_contacts_read_their_column(final):
+    mesh, components = final
+    contacts = [c for c in components if c['kind'] in ('tip_contact', 'contact', 'segment')]
+    amplitudes = np.arange(1, 3 * len(contacts) + 1, dtype=np.float32).reshape(3, -1)
+    animation = stimulation.AmplitudeAnimation(amplitudes, mesh.component_index, [c['name'] for c in components])
+
+    for frame in range(3):
+        values = animation.face_values(frame)
+        for i, component in enumerate(components):
+            faces = values[mesh.component_index == i]
+            if component in contacts:
+                assert (faces == amplitudes[frame, int(component['name'][3:])]).all()
+            else:
+                # insulations, the inner bore and the marker (numbered after the last contact) have no column
+                assert (faces == 0).all(), component['name']
+
+
+def test_insulation_and_marker_read_zero(final):
+    mesh, components = final
+    kinds = np.array([c['kind'] for c in components])[mesh.component_index]
+    nr_contacts = sum(c['kind'] in ('tip_contact', 'contact', 'segment') for c in components)
+    animation = stimulation.AmplitudeAnimation(np.full((2, nr_contacts), 5.0), mesh.component_index, [c['name'] for c in components])
+    values = animation.face_values(1)
+    assert (values[np.isin(kinds, ('tip_insulation', 'insulation', 'gap', 'window', 'marker'))] == 0).all()
+    assert (values[np.isin(kinds, ('tip_contact', 'contact', 'segment'))] == 5).all()
+
+
+def test_frames_outside_the_range_are_clamped():
+    amplitudes = np.array([[1, 2], [3, 4], [5, 6]], dtype=np.float32)
+    animation = stimulation.AmplitudeAnimation(amplitudes, [0, 1, 2, 1], ['con0', 'con1', 'ins0'])
+    assert animation.nr_frames == 3
+    assert list(animation.face_values(-5)) == [1, 2, 0, 2]
+    assert list(animation.face_values(1)) == [3, 4, 0, 4]
+    assert list(animation.face_values(3)) == list(animation.face_values(100)) == [5, 6, 0, 6]
+
+
+def test_read_csv_with_and_without_header(tmp_path):
+    with_header, without_header = tmp_path / 'a.csv', tmp_path / 'b.csv'
+    with_header.write_text('con0,con1\n1,2\n3,4\n')
+    without_header.write_text('1,2\n3,4\n')
+    for path in (with_header, without_header):
+        assert stimulation.read_amplitudes(str(path)).tolist() == [[1, 2], [3, 4]]